@@ -0,0 +1,270 @@
+# Génération en lot sans interface : un business plan par dossier de candidature (PDF et/ou texte),
+# plusieurs plans en parallèle, reprise après interruption et rapport de synthèse
+#
+#   python batch.py candidatures/ --output resultats/ [--formats pdf,docx] [--concurrency 4]
+#   python batch.py manifeste.json --output resultats/
+#
+# Répertoire : un plan par fichier .pdf, avec le texte du .txt de même nom s'il existe
+# (un .txt seul donne un plan sans PDF).
+# Manifeste : liste JSON (ou une ligne JSON par plan) de {"id", "pdf", "text" ou "text_file"},
+# chemins relatifs au manifeste.
+
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import clients
+import config
+import metrics
+import pipeline
+import rate_limiter
+import routing
+from exports import EXPORTERS, ExportService
+from ingestion import open_pdf
+from resources import ResourcePool, entry_size, get_manager
+from section_cache import SectionCache
+from semantic_cache import SemanticCache
+
+BatchItem = namedtuple("BatchItem", ["id", "pdf", "text"])
+
+DONE = "done"
+FAILED = "failed"
+
+# Un enregistrement JSON par plan terminé, ajouté au fil de l'eau : base de la reprise
+CHECKPOINT = "checkpoint.jsonl"
+SUMMARY = "summary.json"
+MARKDOWN = "business_plan.md"
+
+
+def _read_text(path):
+    with open(path, encoding="utf-8") as f:
+        return f.read()
+
+
+def _directory_items(directory):
+    names = sorted(os.listdir(directory))
+    stems = {}
+    for name in names:
+        stem, extension = os.path.splitext(name)
+        if extension.lower() in (".pdf", ".txt"):
+            stems.setdefault(stem, {})[extension.lower()] = os.path.join(directory, name)
+    return [
+        BatchItem(stem, files.get(".pdf"), _read_text(files[".txt"]) if ".txt" in files else "")
+        for stem, files in stems.items()
+    ]
+
+
+def _manifest_items(path):
+    content = _read_text(path).strip()
+    if content.startswith("["):
+        entries = json.loads(content)
+    else:
+        entries = [json.loads(line) for line in content.splitlines() if line.strip()]
+    base = os.path.dirname(os.path.abspath(path))
+    items = []
+    for index, entry in enumerate(entries):
+        pdf = os.path.join(base, entry["pdf"]) if entry.get("pdf") else None
+        text = entry.get("text") or ""
+        if entry.get("text_file"):
+            text = _read_text(os.path.join(base, entry["text_file"]))
+        item_id = str(entry.get("id") or (os.path.splitext(os.path.basename(pdf))[0] if pdf else index + 1))
+        items.append(BatchItem(item_id, pdf, text))
+    return items
+
+
+def load_items(path):
+    # Répertoire de candidatures ou manifeste
+    items = _directory_items(path) if os.path.isdir(path) else _manifest_items(path)
+    seen = set()
+    for item in items:
+        if item.id in seen:
+            raise ValueError(f"Identifiant de plan en double : {item.id}")
+        if not item.pdf and not item.text.strip():
+            raise ValueError(f"Plan {item.id} : ni PDF ni texte fourni.")
+        if item.pdf and not os.path.exists(item.pdf):
+            raise ValueError(f"Plan {item.id} : fichier introuvable ({item.pdf}).")
+        seen.add(item.id)
+    return items
+
+
+def read_checkpoint(output_dir):
+    # Dernier enregistrement par plan
+    records = {}
+    try:
+        with open(os.path.join(output_dir, CHECKPOINT), encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    record = json.loads(line)
+                    records[record["id"]] = record
+    except FileNotFoundError:
+        pass
+    return records
+
+
+class BatchRunner:
+    # Plans traités en parallèle (concurrency), chacun générant ses sections en parallèle
+    # (MAX_CONCURRENT_SECTIONS) : jusqu'à concurrency × MAX_CONCURRENT_SECTIONS appels au LLM simultanés.
+    # Les sections terminées sont dans le cache de sections : un plan interrompu reprend là où il s'était arrêté.
+
+    def __init__(self, output_dir, formats=("pdf",), concurrency=None, cache=None, semantic_cache=None, export_service=None):
+        unknown = [name for name in formats if name not in EXPORTERS]
+        if unknown:
+            raise ValueError(f"Format d'export inconnu : {', '.join(unknown)}")
+        self.output_dir = output_dir
+        self.formats = tuple(formats)
+        self.concurrency = concurrency or config.BATCH_CONCURRENCY
+        self.cache = cache or SectionCache(memory=ResourcePool(get_manager(), "section", entry_size))
+        self.semantic_cache = semantic_cache if semantic_cache is not None else (SemanticCache() if config.SEMANTIC_CACHE else None)
+        self.export_service = export_service or ExportService()
+        self._lock = threading.Lock()
+        os.makedirs(output_dir, exist_ok=True)
+
+    def plan_dir(self, item_id):
+        return os.path.join(self.output_dir, item_id)
+
+    def _artifacts(self):
+        return [MARKDOWN] + [EXPORTERS[name].file_name for name in self.formats]
+
+    def _completed(self, record):
+        # Plan réussi dont tous les fichiers demandés sont présents
+        return record is not None and record["status"] == DONE and all(
+            os.path.exists(os.path.join(self.plan_dir(record["id"]), file_name)) for file_name in self._artifacts()
+        )
+
+    def _checkpoint(self, record):
+        with self._lock, open(os.path.join(self.output_dir, CHECKPOINT), "a", encoding="utf-8") as f:
+            f.write(json.dumps(record, ensure_ascii=False) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+
+    def _write(self, item_id, file_name, data):
+        path = os.path.join(self.plan_dir(item_id), file_name)
+        with open(f"{path}.tmp", "wb") as f:
+            f.write(data)
+        os.replace(f"{path}.tmp", path)
+
+    def process(self, item):
+        # Génère un plan et ses exports ; renvoie l'enregistrement du checkpoint
+        started = time.perf_counter()
+        trace = metrics.Trace(item.id)
+        record = {"id": item.id, "status": FAILED}
+        try:
+            pdf_bytes = None
+            if item.pdf:
+                with open(item.pdf, "rb") as f:
+                    pdf_bytes = f.read()
+                # Document hors limites : échec du plan avant toute section
+                open_pdf(pdf_bytes)
+            # Les appels du lot passent après ceux des sessions interactives du même worker
+            with metrics.activate(trace), rate_limiter.priority(rate_limiter.BATCH), metrics.span("plan"):
+                generated = pipeline.generate_sections(
+                    pdf_bytes,
+                    os.path.basename(item.pdf) if item.pdf else None,
+                    item.text,
+                    self.cache,
+                    semantic_cache=self.semantic_cache,
+                )
+                failed = [name for name, entry in generated.items() if entry.get("error")]
+                if failed:
+                    # Les sections en erreur ne sont pas mises en cache : une reprise les régénère
+                    raise ValueError(f"Sections en erreur : {', '.join(failed)}")
+                results = {name: entry["content"] for name, entry in generated.items()}
+                markdown_content, meta = pipeline.build_business_plan(results)
+            os.makedirs(self.plan_dir(item.id), exist_ok=True)
+            self._write(item.id, MARKDOWN, markdown_content.encode("utf-8"))
+            for name, data in self.export_service.render(self.formats, markdown_content, meta, trace=trace).items():
+                self._write(item.id, EXPORTERS[name].file_name, data)
+            record["status"] = DONE
+        except Exception as e:
+            record["error"] = f"{type(e).__name__}: {e}"
+        calls = [span for span in trace.to_list() if span["stage"] == "llm_call"]
+        record.update(
+            seconds=round(time.perf_counter() - started, 3),
+            llm_calls=len(calls),
+            prompt_tokens=sum(span.get("prompt_tokens", 0) for span in calls),
+            completion_tokens=sum(span.get("completion_tokens", 0) for span in calls),
+            cost_usd=round(sum(span.get("cost_usd", 0.0) for span in calls), 5),
+            finished_at=time.time(),
+        )
+        metrics.count("plans", status=record["status"])
+        metrics.log_trace(trace, status=record["status"])
+        return record
+
+    def run(self, items, resume=True, on_progress=None):
+        # on_progress(enregistrement, terminés, total) après chaque plan
+        previous = read_checkpoint(self.output_dir) if resume else {}
+        skipped = [item for item in items if self._completed(previous.get(item.id))]
+        todo = [item for item in items if item not in skipped]
+        records = []
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix="ishai-batch") as executor:
+            futures = [executor.submit(self.process, item) for item in todo]
+            for future in as_completed(futures):
+                record = future.result()
+                self._checkpoint(record)
+                records.append(record)
+                if on_progress:
+                    on_progress(record, len(records), len(todo))
+        summary = summarize(records, time.perf_counter() - started, skipped=len(skipped))
+        # Latence et coût par section et par modèle sur l'ensemble du lot
+        summary["routing"] = routing.STATS.summary()
+        with open(os.path.join(self.output_dir, SUMMARY), "w", encoding="utf-8") as f:
+            json.dump(summary, f, indent=2, ensure_ascii=False)
+        return summary
+
+
+def summarize(records, elapsed, skipped=0):
+    done = [record for record in records if record["status"] == DONE]
+    return {
+        "plans": len(records) + skipped,
+        "processed": len(records),
+        "skipped": skipped,
+        "done": len(done),
+        "failed": len(records) - len(done),
+        "elapsed_seconds": round(elapsed, 3),
+        "plans_per_hour": round(len(done) * 3600 / elapsed, 1) if elapsed else 0.0,
+        "mean_plan_seconds": round(sum(record["seconds"] for record in done) / len(done), 3) if done else 0.0,
+        "llm_calls": sum(record["llm_calls"] for record in records),
+        "prompt_tokens": sum(record["prompt_tokens"] for record in records),
+        "completion_tokens": sum(record["completion_tokens"] for record in records),
+        "cost_usd": round(sum(record.get("cost_usd", 0.0) for record in records), 4),
+        "failures": [{"id": record["id"], "error": record["error"]} for record in records if record["status"] != DONE],
+    }
+
+
+def run_batch(input_path, output_dir, formats=("pdf",), concurrency=None, resume=True, on_progress=None):
+    # Point d'entrée Python : la clé API est lue dans OPENAI_API_KEY si clients.configure() n'a pas été appelé
+    try:
+        clients.get_api_key()
+    except ValueError:
+        clients.configure()
+    runner = BatchRunner(output_dir, formats=formats, concurrency=concurrency)
+    return runner.run(load_items(input_path), resume=resume, on_progress=on_progress)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Génération de business plans en lot")
+    parser.add_argument("input", help="répertoire de candidatures ou manifeste JSON")
+    parser.add_argument("--output", required=True, help="répertoire des plans générés")
+    parser.add_argument("--formats", default="pdf", help=f"formats d'export séparés par des virgules ({', '.join(EXPORTERS)})")
+    parser.add_argument("--concurrency", type=int, default=None, help="nombre de plans générés en parallèle")
+    parser.add_argument("--no-resume", action="store_true", help="régénérer aussi les plans déjà terminés")
+    args = parser.parse_args()
+
+    def progress(record, finished, total):
+        status = "ok" if record["status"] == DONE else f"échec ({record['error']})"
+        print(f"[{finished}/{total}] {record['id']} : {status} en {record['seconds']:.1f} s", file=sys.stderr)
+
+    formats = [name.strip() for name in args.formats.split(",") if name.strip()]
+    summary = run_batch(args.input, args.output, formats, args.concurrency, resume=not args.no_resume, on_progress=progress)
+    print(json.dumps(summary, indent=2, ensure_ascii=False))
+    sys.exit(1 if summary["failed"] else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,65 @@
+# Mesure de l'export Markdown → Word sur un business plan volumineux généré synthétiquement
+#
+#   python benchmarks/bench_docx_export.py [--sections 8] [--rows 50] [--repeat 5]
+
+import argparse
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from pipeline import generate_markdown, markdown_to_word_via_text  # noqa: E402
+
+
+def synthetic_results(sections, rows):
+    results = {}
+    for s in range(sections):
+        lines = [f"### {s + 1}.1 Présentation", ""]
+        for p in range(6):
+            lines.append(f"Paragraphe {p} avec du **gras**, de l'*italique* et un montant de {p * 1500} US $.")
+        lines.append("")
+        for b in range(10):
+            lines.append(f"* Point {b} de la section")
+            lines.append(f"  - Sous-point {b}")
+        lines.append("")
+        lines.append("| Poste de coût | Montant (US $) | Explication |")
+        lines.append("|---------------|----------------|-------------|")
+        for r in range(rows):
+            lines.append(f"| Poste {r} | {r * 125:,} | Détail du calcul **{r}** |")
+        lines.append("")
+        results[f"Section {s + 1}"] = "\n".join(lines)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sections", type=int, default=8)
+    parser.add_argument("--rows", type=int, default=50)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    results = synthetic_results(args.sections, args.rows)
+    markdown_timings, docx_timings = [], []
+    for _ in range(args.repeat):
+        started = time.perf_counter()
+        markdown_content = generate_markdown(results, "Entreprise Test")
+        markdown_timings.append(time.perf_counter() - started)
+
+        started = time.perf_counter()
+        buffer = markdown_to_word_via_text(markdown_content)
+        docx_timings.append(time.perf_counter() - started)
+
+    print(json.dumps({
+        "sections": args.sections,
+        "rows_per_table": args.rows,
+        "markdown_bytes": len(markdown_content.encode("utf-8")),
+        "docx_bytes": len(buffer.getvalue()),
+        "generate_markdown_s": min(markdown_timings),
+        "markdown_to_docx_s": min(docx_timings),
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
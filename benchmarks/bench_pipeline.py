@@ -0,0 +1,357 @@
+# Mesure hors ligne de la génération complète d'un business plan sur des PDF synthétiques :
+# le LLM (openai.ChatCompletion, ChatOpenAI) et les embeddings (OpenAIEmbeddings) sont remplacés
+# par des doublures locales déterministes, aucune connexion réseau n'est autorisée
+#
+#   python benchmarks/bench_pipeline.py [--pages 5,50,200] [--llm-latency 0.05] [--embedding-latency 0.01]
+
+import argparse
+import hashlib
+import importlib
+import json
+import os
+import random
+import resource
+import socket
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+from io import BytesIO
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+WORDS = (
+    "entreprise marché clients production qualité prix service équipe investissement croissance "
+    "distribution fournisseurs stratégie rentabilité innovation région capacité demande formation "
+    "financement matériel local partenaires transport stockage commercialisation besoin projet"
+).split()
+
+
+def block_network():
+    # Toute tentative de connexion hors de la machine échoue immédiatement
+    connect = socket.socket.connect
+
+    def guarded(sock, address):
+        host = address[0] if isinstance(address, tuple) else address
+        if isinstance(host, str) and host not in ("127.0.0.1", "localhost", "::1") and not host.startswith("/"):
+            raise ConnectionError(f"Accès réseau interdit pendant le benchmark : {address}")
+        return connect(sock, address)
+    socket.socket.connect = guarded
+
+
+def synthetic_pdf(pages, seed=0):
+    from markdown_pdf import MarkdownPdf, Section
+
+    rng = random.Random(seed)
+    pdf = MarkdownPdf()
+    for page in range(pages):
+        paragraphs = [
+            " ".join(rng.choice(WORDS) for _ in range(rng.randint(60, 120))).capitalize() + "."
+            for _ in range(4)
+        ]
+        pdf.add_section(Section(f"# Page {page + 1}\n\n" + "\n\n".join(paragraphs)))
+    buffer = BytesIO()
+    pdf.save(buffer)
+    return buffer.getvalue()
+
+
+class FakeLLM:
+    # Réponses déterministes (graine = empreinte du prompt) au format Markdown du business plan,
+    # avec un tableau chiffré lorsque les consignes en demandent un
+
+    def __init__(self, latency, seconds_per_token, completion_words):
+        self.latency = latency
+        self.seconds_per_token = seconds_per_token
+        self.completion_words = completion_words
+        self.calls = 0
+
+    def answer(self, messages):
+        prompt = "\n".join(message["content"] for message in messages)
+        rng = random.Random(hashlib.sha256(prompt.encode("utf-8")).hexdigest())
+        lines = ["Le nom de l'entreprise est Entreprise Test.", ""]
+        words = 0
+        while words < self.completion_words:
+            sentence = " ".join(rng.choice(WORDS) for _ in range(rng.randint(12, 25)))
+            lines.append(sentence.capitalize() + ".")
+            lines.append("")
+            words += len(sentence.split())
+            if rng.random() < 0.3:
+                lines.extend(f"* {rng.choice(WORDS).capitalize()} et {rng.choice(WORDS)}" for _ in range(3))
+                lines.append("")
+        if "| Poste de" in prompt:
+            lines.extend(["| Poste de coût | Montant (US $) | Explication |", "|---|---|---|"])
+            total = 0
+            for index in range(8):
+                amount = rng.randint(1, 400) * 50
+                total += amount
+                lines.append(f"| Poste {index + 1} | {amount:,} | {rng.choice(WORDS)} |".replace(",", " "))
+            lines.append(f"| **Total** | {total:,} | |".replace(",", " "))
+        return "\n".join(lines)
+
+    def create(self, **kwargs):
+        from context_builder import count_message_tokens, count_tokens
+
+        self.calls += 1
+        content = self.answer(kwargs["messages"])
+        completion_tokens = count_tokens(content)
+        if not kwargs.get("stream"):
+            time.sleep(self.latency + completion_tokens * self.seconds_per_token)
+            usage = {"prompt_tokens": count_message_tokens(kwargs["messages"]), "completion_tokens": completion_tokens}
+            return {"choices": [{"message": {"role": "assistant", "content": content}}], "usage": usage}
+        return self._stream(content)
+
+    def _stream(self, content):
+        time.sleep(self.latency)
+        for start in range(0, len(content), 16):
+            time.sleep(self.seconds_per_token * 4)
+            yield {"choices": [{"delta": {"content": content[start:start + 16]}}]}
+
+
+class FakeEmbeddings:
+    # Vecteurs pseudo-aléatoires unitaires dérivés de l'empreinte du texte
+
+    def __init__(self, latency=0.0, dimension=256, **kwargs):
+        self.latency = latency
+        self.dimension = dimension
+        self.calls = 0
+        self.texts = 0
+
+    def _vector(self, text):
+        import numpy as np
+
+        seed = int.from_bytes(hashlib.sha256(text.encode("utf-8")).digest()[:8], "little")
+        vector = np.random.default_rng(seed).standard_normal(self.dimension)
+        return (vector / np.linalg.norm(vector)).tolist()
+
+    def embed_documents(self, texts):
+        self.calls += 1
+        self.texts += len(texts)
+        time.sleep(self.latency)
+        return [self._vector(text) for text in texts]
+
+    def embed_query(self, text):
+        return self.embed_documents([text])[0]
+
+
+def install_fakes(llm, embeddings):
+    import openai
+
+    # clients.py importe ces classes à leur première utilisation : on remplace les attributs des modules
+    chat_models = importlib.import_module("langchain.chat_models")
+    embedding_models = importlib.import_module("langchain.embeddings")
+    openai.ChatCompletion.create = llm.create
+    embedding_models.OpenAIEmbeddings = lambda **kwargs: embeddings
+
+    def chat_model(**kwargs):
+        # Mode "chain" uniquement : modèle factice de langchain, réponses fixes
+        from langchain.chat_models.fake import FakeListChatModel
+
+        return FakeListChatModel(responses=[llm.answer([{"content": "question reformulée"}])] * 1000)
+    chat_models.ChatOpenAI = chat_model
+
+
+class Timers:
+    # Temps cumulé de sous-étapes appelées de nombreuses fois (recherche, assemblage du prompt)
+
+    def __init__(self):
+        self.seconds = {}
+
+    def wrap(self, name, func):
+        def timed(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                self.seconds[name] = self.seconds.get(name, 0.0) + time.perf_counter() - started
+        return timed
+
+
+def _rss(pid):
+    # Mémoire résidente d'un processus (Linux), 0 s'il a disparu
+    try:
+        with open(f"/proc/{pid}/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return 0
+
+
+def _descendants(pid):
+    # Processus enfants (pools d'ingestion et d'export) et leurs propres enfants
+    parents = {}
+    for name in os.listdir("/proc"):
+        if name.isdigit():
+            try:
+                with open(f"/proc/{name}/stat") as f:
+                    # Le nom du processus est entre parenthèses et peut contenir des espaces
+                    parents.setdefault(int(f.read().rsplit(")", 1)[1].split()[1]), []).append(int(name))
+            except (OSError, ValueError, IndexError):
+                continue
+    found, pending = [], [pid]
+    while pending:
+        children = parents.get(pending.pop(), [])
+        found.extend(children)
+        pending.extend(children)
+    return found
+
+
+class RssSampler(threading.Thread):
+    # Pic de mémoire résidente du processus et de ses enfants pendant une étape, relevé
+    # périodiquement dans /proc (ru_maxrss ne donne que le pic depuis le démarrage)
+
+    def __init__(self, interval=0.01):
+        super().__init__(daemon=True)
+        self.interval = interval
+        self.available = os.path.exists("/proc/self/statm")
+        self.start_bytes = self.sample() if self.available else 0
+        self.peak_bytes = self.start_bytes
+        self._done = threading.Event()
+
+    def sample(self):
+        pid = os.getpid()
+        return _rss(pid) + sum(_rss(child) for child in _descendants(pid))
+
+    def run(self):
+        while not self._done.wait(self.interval):
+            self.peak_bytes = max(self.peak_bytes, self.sample())
+
+    def stop(self):
+        self._done.set()
+        self.join()
+        self.peak_bytes = max(self.peak_bytes, self.sample())
+
+
+@contextmanager
+def stage(report, name, memory=False):
+    # Passe de temps : temps réel seul, sans instrumentation qui fausserait la mesure.
+    # Passe mémoire : pic d'allocations Python (tracemalloc) et pic de mémoire résidente
+    # de l'étape, processus enfants compris.
+    entry = report.setdefault(name, {})
+    if not memory:
+        started = time.perf_counter()
+        try:
+            yield entry
+        finally:
+            entry["seconds"] = round(time.perf_counter() - started, 4)
+        return
+    sampler = RssSampler()
+    if sampler.available:
+        sampler.start()
+    tracemalloc.start()
+    try:
+        yield {}
+    finally:
+        entry["peak_python_mb"] = round(tracemalloc.get_traced_memory()[1] / 1e6, 2)
+        tracemalloc.stop()
+        if sampler.available:
+            sampler.stop()
+            entry["peak_rss_mb"] = round(sampler.peak_bytes / 1e6, 1)
+            entry["rss_growth_mb"] = round((sampler.peak_bytes - sampler.start_bytes) / 1e6, 1)
+        else:
+            # Hors Linux : pics depuis le démarrage, pas propres à l'étape
+            entry["process_max_rss_since_start_mb"] = round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+            entry["children_max_rss_since_start_mb"] = round(resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024, 1)
+
+
+def run(pages, args, llm, embeddings):
+    # Deux passages complets, caches vides à chaque fois : le premier mesure les temps,
+    # le second la mémoire
+    pdf_bytes = synthetic_pdf(pages)
+    report = {"pages": pages, "pdf_bytes": len(pdf_bytes), "stages": {}}
+    for memory in (False, True):
+        run_pass(pdf_bytes, args, llm, embeddings, report["stages"], memory)
+    report["total_seconds"] = round(sum(entry["seconds"] for entry in report["stages"].values()), 4)
+    return report
+
+
+def run_pass(pdf_bytes, args, llm, embeddings, stages, memory):
+    import clients
+    import config
+    import pipeline
+    from exports import EXPORTERS
+    from resources import get_manager
+    from section_cache import SectionCache
+
+    # L'index gardé en mémoire par le passage précédent serait réutilisé sans reconstruction
+    get_manager().discard(("index", pipeline.document_hash(pdf_bytes)))
+    cache_dir = tempfile.mkdtemp(prefix="ishai-bench-")
+    config.FAISS_CACHE_DIR = os.path.join(cache_dir, "faiss")
+    config.EMBEDDING_CACHE_DIR = os.path.join(cache_dir, "embeddings")
+    clients.get_embeddings.cache_clear()
+    llm.calls, embeddings.calls, embeddings.texts = 0, 0, 0
+
+    with stage(stages, "ingestion_indexing", memory) as entry:
+        ingestion = {}
+        doc_hash = pipeline.document_hash(pdf_bytes)
+        db = pipeline.load_or_create_faiss_db(pdf_bytes, doc_hash, "synthetic.pdf", stats=ingestion)
+        entry.update(
+            pages_per_second=round(ingestion.get("pages_per_second", 0.0), 1),
+            chunks=db.index.ntotal if db is not None else 0,
+            embedding_calls=embeddings.calls,
+            embedded_texts=embeddings.texts,
+        )
+
+    timers = Timers()
+    original = pipeline.build_context, pipeline.retrieve_chunks
+    pipeline.build_context = timers.wrap("prompt_assembly", pipeline.build_context)
+    pipeline.retrieve_chunks = timers.wrap("retrieval", pipeline.retrieve_chunks)
+    try:
+        with stage(stages, "generation", memory) as entry:
+            cache = SectionCache(memory={}, directory=os.path.join(cache_dir, "sections"))
+            on_token = (lambda name, delta: None) if args.stream else None
+            generated = pipeline.generate_sections(pdf_bytes, "synthetic.pdf", args.user_text, cache, on_token=on_token)
+            tokens = [section.get("tokens", {}) for section in generated.values()]
+            entry.update(
+                sections=len(generated),
+                llm_calls=llm.calls,
+                prompt_tokens=sum(t.get("prompt_tokens", 0) for t in tokens),
+                completion_tokens=sum(t.get("completion_tokens", 0) for t in tokens),
+                context_tokens=sum(t.get("total", 0) for t in tokens),
+                retrieval_seconds=round(timers.seconds.get("retrieval", 0.0), 4),
+                prompt_assembly_seconds=round(timers.seconds.get("prompt_assembly", 0.0), 4),
+            )
+    finally:
+        pipeline.build_context, pipeline.retrieve_chunks = original
+
+    with stage(stages, "markdown", memory) as entry:
+        results = {name: section["content"] for name, section in generated.items()}
+        markdown_content, meta = pipeline.build_business_plan(results)
+        entry["bytes"] = len(markdown_content.encode("utf-8"))
+
+    for name, exporter in EXPORTERS.items():
+        with stage(stages, f"export_{name}", memory) as entry:
+            entry["bytes"] = len(exporter.render(markdown_content, meta))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--pages", default="5,50,200", help="tailles des PDF synthétiques, séparées par des virgules")
+    parser.add_argument("--llm-latency", type=float, default=0.05, help="latence fixe d'un appel au LLM (s)")
+    parser.add_argument("--seconds-per-token", type=float, default=0.0005, help="latence par jeton généré (s)")
+    parser.add_argument("--completion-words", type=int, default=400)
+    parser.add_argument("--embedding-latency", type=float, default=0.01, help="latence d'un lot d'embeddings (s)")
+    parser.add_argument("--stream", action="store_true", help="génération en mode flux")
+    parser.add_argument("--user-text", default="Entreprise Test : production et vente de jus de fruits locaux.")
+    parser.add_argument("--output", help="fichier JSON de sortie (sinon sortie standard)")
+    args = parser.parse_args()
+
+    block_network()
+    import clients
+
+    clients.configure("sk-benchmark")
+    llm = FakeLLM(args.llm_latency, args.seconds_per_token, args.completion_words)
+    embeddings = FakeEmbeddings(latency=args.embedding_latency)
+    install_fakes(llm, embeddings)
+
+    reports = [run(int(pages), args, llm, embeddings) for pages in args.pages.split(",")]
+    output = json.dumps({"runs": reports}, indent=2, ensure_ascii=False)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(output + "\n")
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    main()
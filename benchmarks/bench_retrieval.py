@@ -0,0 +1,155 @@
+# Mesure hors ligne de la recherche d'extraits par section : rappel des extraits pertinents,
+# latence, jetons de contexte et recouvrement entre sections, pour la similarité vectorielle
+# seule ("direct") et la recherche hybride BM25 + vecteurs avec MMR ("hybrid").
+#
+# Corpus synthétique : pour chaque section, quelques extraits pertinents (vocabulaire du thème)
+# noyés dans des extraits de remplissage ; embeddings locaux par hachage des mots, aucun réseau.
+#
+#   python benchmarks/bench_retrieval.py [--filler 400] [--relevant 4] [--k 6] [--repeat 20]
+
+import argparse
+import hashlib
+import json
+import os
+import random
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bench_pipeline import WORDS, block_network
+from langchain.embeddings.base import Embeddings
+
+# Vocabulaire propre à chaque section, utilisé pour rédiger les extraits pertinents
+TOPICS = {
+    "Résumé Exécutif": "synthèse vision objectifs chiffre d'affaires rentabilité résumé ambition",
+    "Présentation du Projet": "projet activité produit concept origine idée localisation description",
+    "Présentation des Porteurs de Projet": "fondateur équipe expérience diplôme compétences qualifications membres parcours",
+    "Analyse de Marché": "marché cible concurrents clientèle demande segment tendance part",
+    "Moyens de Production et Organisation": "production atelier machines organisation opérationnelle personnel approvisionnement procédé",
+    "Stratégie Marketing et Moyens Commerciaux": "marketing publicité promotion prix vente canaux communication plan",
+    "Besoin de Démarrage": "investissement équipement fonds de roulement démarrage besoins financement coût",
+    "Annexes": "annexes documents statuts attestations devis contrats pièces justificatifs",
+}
+
+
+class HashingEmbeddings(Embeddings):
+    # Sac de mots haché en vecteur unitaire : des textes au vocabulaire proche ont des vecteurs proches
+
+    def __init__(self, dimension=512):
+        self.dimension = dimension
+
+    def _vector(self, text):
+        import numpy as np
+
+        from retrieval import tokenize
+
+        vector = np.zeros(self.dimension, dtype=np.float32)
+        for term in tokenize(text):
+            digest = hashlib.md5(term.encode("utf-8")).digest()
+            vector[int.from_bytes(digest[:4], "little") % self.dimension] += 1 if digest[4] & 1 else -1
+        norm = np.linalg.norm(vector)
+        return (vector / norm if norm else vector).tolist()
+
+    def embed_documents(self, texts):
+        return [self._vector(text) for text in texts]
+
+    def embed_query(self, text):
+        return self._vector(text)
+
+
+def corpus(filler, relevant, seed=0):
+    # Liste de (texte, section pertinente ou None)
+    rng = random.Random(seed)
+
+    def sentence(vocabulary, share):
+        words = [rng.choice(vocabulary) if rng.random() < share else rng.choice(WORDS) for _ in range(rng.randint(40, 80))]
+        return " ".join(words).capitalize() + "."
+    chunks = [(sentence(WORDS, 0.0), None) for _ in range(filler)]
+    for name, topic in TOPICS.items():
+        vocabulary = topic.split()
+        chunks.extend((sentence(vocabulary, 0.25), name) for _ in range(relevant))
+    rng.shuffle(chunks)
+    return chunks
+
+
+def run(args):
+    from langchain.vectorstores import FAISS
+
+    import config
+    import pipeline
+    from context_builder import count_tokens
+    from retrieval import query_vectors, retriever_for
+
+    embeddings = HashingEmbeddings()
+    chunks = corpus(args.filler, args.relevant)
+    db = FAISS.from_texts([text for text, _ in chunks], embeddings)
+    relevant = {name: {text for text, section in chunks if section == name} for name in TOPICS}
+    queries = {name: template.query for name, template in pipeline.TEMPLATES.items() if name in TOPICS}
+
+    # Index BM25 et vecteurs des requêtes préparés une fois, comme dans l'application
+    started = time.perf_counter()
+    retriever_for(db)
+    vectors = query_vectors(list(queries.values()), embeddings)
+    preparation = time.perf_counter() - started
+
+    report = {"chunks": len(chunks), "k": args.k, "hybrid_preparation_seconds": round(preparation, 4), "modes": {}}
+    for mode in ("direct", "hybrid"):
+        sections = {}
+        retrieved_by_section = {}
+        for name, query in queries.items():
+            latencies = []
+            for _ in range(args.repeat):
+                started = time.perf_counter()
+                if mode == "hybrid":
+                    retrieved = retriever_for(db).search(query, vectors[query], k=args.k)
+                else:
+                    # Comportement d'origine : la requête est embeddée à chaque recherche
+                    retrieved = [document.page_content for document in db.similarity_search(query, k=args.k)]
+                latencies.append(time.perf_counter() - started)
+            retrieved_by_section[name] = retrieved
+            found = len(relevant[name] & set(retrieved))
+            sections[name] = {
+                "recall": round(found / len(relevant[name]), 3),
+                "precision": round(found / len(retrieved), 3) if retrieved else 0.0,
+                "latency_ms": round(statistics.median(latencies) * 1000, 3),
+                "context_tokens": sum(count_tokens(text) for text in retrieved),
+            }
+        # Extraits reçus par plusieurs sections : le défaut des requêtes génériques
+        seen = [text for retrieved in retrieved_by_section.values() for text in retrieved]
+        report["modes"][mode] = {
+            "mean_recall": round(statistics.mean(section["recall"] for section in sections.values()), 3),
+            "mean_latency_ms": round(statistics.mean(section["latency_ms"] for section in sections.values()), 3),
+            "context_tokens": sum(section["context_tokens"] for section in sections.values()),
+            "shared_chunks": len(seen) - len(set(seen)),
+            "sections": sections,
+        }
+    report["settings"] = {
+        "fetch_k": config.RETRIEVAL_FETCH_K,
+        "lexical_weight": config.RETRIEVAL_LEXICAL_WEIGHT,
+        "mmr_lambda": config.RETRIEVAL_MMR_LAMBDA,
+    }
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--filler", type=int, default=400, help="extraits de remplissage")
+    parser.add_argument("--relevant", type=int, default=4, help="extraits pertinents par section")
+    parser.add_argument("--k", type=int, default=6, help="extraits retenus par section")
+    parser.add_argument("--repeat", type=int, default=20, help="recherches par section pour la latence")
+    parser.add_argument("--output", help="fichier JSON de sortie (sinon sortie standard)")
+    args = parser.parse_args()
+
+    block_network()
+    output = json.dumps(run(args), indent=2, ensure_ascii=False)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(output + "\n")
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+# Contrôle du temps de démarrage : importe dans un processus neuf les modules chargés par base.py
+# et échoue si le budget est dépassé ou si une dépendance lourde est importée au démarrage
+#
+#   python benchmarks/check_import_time.py [--budget 1.5] [--repeat 3]
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Modules importés par base.py au démarrage (streamlit mis à part, mesuré séparément)
+STARTUP_MODULES = ["clients", "config", "pipeline", "exports", "financial_tables", "jobs"]
+
+# Dépendances qui ne doivent être chargées qu'à la demande (PDF envoyé, export demandé...)
+LAZY_MODULES = ["langchain", "langchain_community", "faiss", "docx", "markdown_pdf", "xlsxwriter", "pypdf"]
+
+PROBE = """
+import json, sys, time
+started = time.perf_counter()
+import {modules}
+elapsed = time.perf_counter() - started
+loaded = sorted({{name.split(".")[0] for name in sys.modules}} & set({lazy!r}))
+print(json.dumps({{"seconds": elapsed, "loaded": loaded}}))
+"""
+
+
+def measure(modules, lazy):
+    # Processus neuf à chaque mesure : rien n'est déjà en mémoire
+    code = PROBE.format(modules=", ".join(modules), lazy=lazy)
+    completed = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        cwd=ROOT,
+        capture_output=True,
+        text=True,
+    )
+    if completed.returncode != 0:
+        raise RuntimeError(completed.stderr.strip().splitlines()[-1] if completed.stderr.strip() else "échec de l'import")
+    result = json.loads(completed.stdout.strip().splitlines()[-1])
+    result["slowest"] = slowest_imports(completed.stderr)
+    return result
+
+
+def slowest_imports(importtime_output, count=10):
+    # Sortie de -X importtime : "import time: self [us] | cumulative | module", la profondeur
+    # est donnée par l'indentation ; on garde les modules importés directement et leurs dépendances
+    imports = []
+    for line in importtime_output.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        if depth <= 1:
+            imports.append((int(cumulative) / 1e6, name.strip()))
+    return [{"module": name, "seconds": round(seconds, 4)} for seconds, name in sorted(imports, reverse=True)[:count]]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--budget", type=float, default=1.5, help="temps d'import maximal en secondes")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    runs = [measure(STARTUP_MODULES, LAZY_MODULES) for _ in range(args.repeat)]
+    best = min(runs, key=lambda run: run["seconds"])
+    report = {
+        "modules": STARTUP_MODULES,
+        "budget_seconds": args.budget,
+        "best_seconds": round(best["seconds"], 4),
+        "runs_seconds": [round(run["seconds"], 4) for run in runs],
+        "eagerly_loaded": best["loaded"],
+        "slowest_imports": best["slowest"],
+    }
+    print(json.dumps(report, indent=2, ensure_ascii=False))
+
+    failures = []
+    if best["seconds"] > args.budget:
+        failures.append(f"démarrage en {best['seconds']:.2f} s, budget {args.budget:.2f} s")
+    if best["loaded"]:
+        failures.append(f"dépendances chargées au démarrage : {', '.join(best['loaded'])}")
+    if failures:
+        print("ÉCHEC : " + " ; ".join(failures), file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
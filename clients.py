@@ -0,0 +1,81 @@
+import os
+from functools import lru_cache
+
+import openai
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+import config
+
+# Clients OpenAI partagés par toutes les sessions et tous les threads du processus
+# (les clients langchain ne sont importés qu'à leur première utilisation)
+
+_api_key = None
+
+
+class _SharedSession(requests.Session):
+    # openai ferme et recrée sa session HTTP toutes les quelques minutes ;
+    # la session partagée reste ouverte pour conserver les connexions keep-alive
+    def close(self):
+        pass
+
+
+def configure(api_key=None):
+    global _api_key
+    # La clé est transmise explicitement à chaque appel plutôt que via openai.api_key
+    _api_key = api_key or os.environ.get("OPENAI_API_KEY")
+    if config.OPENAI_API_BASE:
+        # Permet de cibler un serveur compatible OpenAI (ex. bouchon local pour les tests)
+        openai.api_base = config.OPENAI_API_BASE
+    openai.requestssession = get_http_session()
+
+
+def get_api_key():
+    if not _api_key:
+        raise ValueError("Clé API OpenAI non configurée.")
+    return _api_key
+
+
+@lru_cache(maxsize=None)
+def get_http_session():
+    session = _SharedSession()
+    # Seules les erreurs de connexion sont rejouées ici ; les 429 sont gérés par call_with_backoff
+    retries = Retry(total=config.HTTP_CONNECT_RETRIES, connect=config.HTTP_CONNECT_RETRIES, read=0, status=0, allowed_methods=None)
+    adapter = HTTPAdapter(pool_connections=config.HTTP_POOL_SIZE, pool_maxsize=config.HTTP_POOL_SIZE, max_retries=retries)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+@lru_cache(maxsize=None)
+def get_chat_llm(model=None, temperature=None):
+    from langchain.chat_models import ChatOpenAI
+
+    # Un client par (modèle, température) : ceux de la route de chaque section
+    return ChatOpenAI(
+        model_name=model or config.CHAT_MODEL,
+        temperature=config.TEMPERATURE if temperature is None else temperature,
+        openai_api_key=get_api_key(),
+        openai_api_base=config.OPENAI_API_BASE,
+        request_timeout=config.OPENAI_TIMEOUT,
+        max_retries=config.MAX_RETRIES,
+    )
+
+
+@lru_cache(maxsize=None)
+def get_embeddings():
+    from langchain.embeddings import OpenAIEmbeddings
+
+    from embedding_cache import CachedEmbeddings
+
+    embeddings = OpenAIEmbeddings(
+        model=config.EMBEDDING_MODEL,
+        openai_api_key=get_api_key(),
+        openai_api_base=config.OPENAI_API_BASE,
+        request_timeout=config.OPENAI_TIMEOUT,
+        max_retries=config.MAX_RETRIES,
+        chunk_size=config.EMBEDDING_BATCH_SIZE,
+    )
+    # Seuls les extraits jamais vus (tous documents confondus) sont envoyés à l'API
+    return CachedEmbeddings(embeddings, config.EMBEDDING_MODEL)
@@ -0,0 +1,138 @@
+import json
+import os
+
+# Paramètres de déploiement (surchargeables par variables d'environnement)
+
+# Répertoire racine des caches persistants (index FAISS, etc.)
+CACHE_DIR = os.environ.get("ISHAI_CACHE_DIR", ".ishai_cache")
+
+# Index FAISS sauvegardés par empreinte du PDF
+FAISS_CACHE_DIR = os.path.join(CACHE_DIR, "faiss")
+
+# Résultats des sections déjà générées
+SECTION_CACHE_DIR = os.path.join(CACHE_DIR, "sections")
+
+# Tâches de génération en arrière-plan
+JOBS_DIR = os.path.join(CACHE_DIR, "jobs")
+JOBS_DB_PATH = os.environ.get("ISHAI_JOBS_DB", os.path.join(CACHE_DIR, "jobs.sqlite3"))
+JOB_WORKERS = int(os.environ.get("ISHAI_JOB_WORKERS", "2"))
+# Délai sans nouvelles après lequel une tâche en cours est considérée comme interrompue
+JOB_STALE_AFTER = float(os.environ.get("ISHAI_JOB_STALE_AFTER", "600"))
+# Durée de conservation des tâches terminées (texte saisi, sections, Markdown) et des PDF qu'elles seules
+# utilisent ; les fichiers du cache des sections et du cache des exports plus anciens sont aussi supprimés
+JOB_RETENTION = float(os.environ.get("ISHAI_JOB_RETENTION", str(30 * 24 * 3600)))
+
+# Mémoire du worker (resources.py) : plafond global et par session des objets gardés en mémoire
+# (index chargés, sections, exports rendus) ; au-delà, les moins récemment utilisés sont relus depuis le disque
+MEMORY_LIMIT_BYTES = int(os.environ.get("ISHAI_MEMORY_LIMIT_MB", "1024")) * 1024 * 1024
+SESSION_MEMORY_LIMIT_BYTES = int(os.environ.get("ISHAI_SESSION_MEMORY_LIMIT_MB", "64")) * 1024 * 1024
+
+# Génération en lot (batch.py) : nombre de plans traités en parallèle
+BATCH_CONCURRENCY = int(os.environ.get("ISHAI_BATCH_CONCURRENCY", "4"))
+
+# Exports (PDF, Word, HTML...) rendus à la demande, par empreinte du Markdown
+EXPORT_CACHE_DIR = os.path.join(CACHE_DIR, "exports")
+EXPORT_WORKERS = int(os.environ.get("ISHAI_EXPORT_WORKERS", "2"))
+
+# Cache sémantique des sections : réutilise la réponse d'un prompt très proche (similarité cosinus
+# au-dessus du seuil). Désactivable globalement ; chaque section l'active dans le manifeste des modèles.
+SEMANTIC_CACHE = os.environ.get("ISHAI_SEMANTIC_CACHE", "1") == "1"
+SEMANTIC_CACHE_DIR = os.path.join(CACHE_DIR, "semantic")
+SEMANTIC_CACHE_THRESHOLD = float(os.environ.get("ISHAI_SEMANTIC_CACHE_THRESHOLD", "0.97"))
+SEMANTIC_CACHE_TTL = float(os.environ.get("ISHAI_SEMANTIC_CACHE_TTL", str(7 * 24 * 3600)))
+SEMANTIC_CACHE_MAX_ENTRIES = int(os.environ.get("ISHAI_SEMANTIC_CACHE_MAX_ENTRIES", "5000"))
+
+# Régénération incrémentale : une section est réutilisée si ses entrées n'ont pas changé
+# (paragraphes du texte identiques ou à une similarité d'embedding au-dessus du seuil)
+INCREMENTAL = os.environ.get("ISHAI_INCREMENTAL", "1") == "1"
+INCREMENTAL_SIMILARITY = float(os.environ.get("ISHAI_INCREMENTAL_SIMILARITY", "0.98"))
+
+# Cache des embeddings par empreinte du texte normalisé et du modèle
+EMBEDDING_CACHE_DIR = os.path.join(CACHE_DIR, "embeddings")
+EMBEDDING_MODEL = os.environ.get("ISHAI_EMBEDDING_MODEL", "text-embedding-ada-002")
+# Nombre de textes envoyés par requête d'embedding (limite API : 2048)
+EMBEDDING_BATCH_SIZE = int(os.environ.get("ISHAI_EMBEDDING_BATCH_SIZE", "1000"))
+
+# Découpage des documents
+CHUNK_SIZE = 1500
+CHUNK_OVERLAP = 200
+
+# Recherche dans le document : "hybrid" (BM25 + vecteurs, diversification MMR), "direct"
+# (similarité vectorielle seule) — extraits injectés dans le prompt, un seul appel au LLM —
+# ou "chain" (ConversationalRetrievalChain, plusieurs appels par section)
+RETRIEVAL_MODE = os.environ.get("ISHAI_RETRIEVAL_MODE", "hybrid")
+RETRIEVAL_TOP_K = int(os.environ.get("ISHAI_RETRIEVAL_TOP_K", "6"))
+# Mode hybride : candidats départagés par MMR, poids du score lexical dans le score combiné
+# et compromis pertinence/diversité de MMR (1 = pertinence seule)
+RETRIEVAL_FETCH_K = int(os.environ.get("ISHAI_RETRIEVAL_FETCH_K", "20"))
+RETRIEVAL_LEXICAL_WEIGHT = float(os.environ.get("ISHAI_RETRIEVAL_LEXICAL_WEIGHT", "0.4"))
+RETRIEVAL_MMR_LAMBDA = float(os.environ.get("ISHAI_RETRIEVAL_MMR_LAMBDA", "0.6"))
+
+# Ingestion des PDF : limites et parallélisme de l'extraction
+MAX_PDF_BYTES = int(os.environ.get("ISHAI_MAX_PDF_BYTES", str(50 * 1024 * 1024)))
+MAX_PDF_PAGES = int(os.environ.get("ISHAI_MAX_PDF_PAGES", "500"))
+INGESTION_WORKERS = int(os.environ.get("ISHAI_INGESTION_WORKERS", str(min(4, os.cpu_count() or 1))))
+INGESTION_PAGES_PER_TASK = 8
+# En dessous de ce nombre de pages, l'extraction reste dans le processus courant
+INGESTION_PARALLEL_MIN_PAGES = 32
+
+# Modèles des sections : répertoire versionné, version et sections retenues pour ce déploiement
+# (ISHAI_SECTIONS : noms séparés par des virgules, vide = toutes les sections du modèle)
+TEMPLATE_DIR = os.environ.get("ISHAI_TEMPLATE_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "templates"))
+TEMPLATE_VERSION = os.environ.get("ISHAI_TEMPLATE_VERSION", "v1")
+SECTIONS = tuple(name.strip() for name in os.environ.get("ISHAI_SECTIONS", "").split(",") if name.strip())
+
+# Modèle de génération des sections
+CHAT_MODEL = os.environ.get("ISHAI_CHAT_MODEL", "gpt-3.5-turbo")
+TEMPERATURE = float(os.environ.get("ISHAI_TEMPERATURE", "0.9"))
+# Routage par section (routing.py) : réglages du manifeste surchargés par ISHAI_ROUTES,
+# ex. {"Annexes": {"model": "gpt-3.5-turbo", "max_tokens": 300, "temperature": 0.5}}
+ROUTES = json.loads(os.environ.get("ISHAI_ROUTES", "{}"))
+# Modèle de repli si le modèle principal dépasse ROUTE_TIMEOUT secondes sans répondre (vide = pas de repli)
+FALLBACK_MODEL = os.environ.get("ISHAI_FALLBACK_MODEL", "")
+ROUTE_TIMEOUT = float(os.environ.get("ISHAI_ROUTE_TIMEOUT", "45"))
+# Tarifs en dollars par millier de jetons (prompt, réponse), pour le coût des sections
+MODEL_PRICES = {
+    "gpt-3.5-turbo": (0.0015, 0.002),
+    "gpt-3.5-turbo-16k": (0.003, 0.004),
+    "gpt-4": (0.03, 0.06),
+    "gpt-4-turbo": (0.01, 0.03),
+    **{model: tuple(prices) for model, prices in json.loads(os.environ.get("ISHAI_MODEL_PRICES", "{}")).items()},
+}
+
+# Affichage progressif des réponses du modèle
+STREAM_SECTIONS = os.environ.get("ISHAI_STREAM_SECTIONS", "1") == "1"
+UI_REFRESH_INTERVAL = 0.2
+
+# Budget de jetons du contexte envoyé pour chaque section
+MODEL_CONTEXT_WINDOW = int(os.environ.get("ISHAI_MODEL_CONTEXT_WINDOW", "4096"))
+COMPLETION_TOKEN_RESERVE = int(os.environ.get("ISHAI_COMPLETION_TOKEN_RESERVE", "1024"))
+CONTEXT_TOKEN_BUDGET = int(os.environ.get("ISHAI_CONTEXT_TOKEN_BUDGET", "2500"))
+
+# Clients OpenAI partagés
+OPENAI_API_BASE = os.environ.get("OPENAI_API_BASE") or None
+OPENAI_TIMEOUT = float(os.environ.get("ISHAI_OPENAI_TIMEOUT", "120"))
+HTTP_POOL_SIZE = int(os.environ.get("ISHAI_HTTP_POOL_SIZE", "20"))
+HTTP_CONNECT_RETRIES = 2
+
+# Métriques : point d'accès Prometheus /metrics (0 = désactivé) et journalisation des traces
+METRICS_PORT = int(os.environ.get("ISHAI_METRICS_PORT", "0"))
+METRICS_LOG = os.environ.get("ISHAI_METRICS_LOG", "1") == "1"
+# Traces journalisées : une ligne JSON par génération, fichier renouvelé au-delà de 50 Mo (3 archives)
+METRICS_LOG_PATH = os.environ.get("ISHAI_METRICS_LOG_PATH", os.path.join(CACHE_DIR, "traces.jsonl"))
+
+# Génération concurrente des sections
+MAX_CONCURRENT_SECTIONS = int(os.environ.get("ISHAI_MAX_CONCURRENT_SECTIONS", "5"))
+
+# Nouvelles tentatives en cas de limitation de débit (429) ou d'erreur transitoire
+MAX_RETRIES = int(os.environ.get("ISHAI_MAX_RETRIES", "5"))
+BACKOFF_BASE_DELAY = 1.0
+BACKOFF_MAX_DELAY = 60.0
+
+# Limitation de débit partagée par les sessions du processus (0 = pas de limite) ;
+# ISHAI_RATE_LIMIT_DB : base SQLite commune pour partager les budgets entre workers
+CHAT_RPM = int(os.environ.get("ISHAI_CHAT_RPM", "3500"))
+CHAT_TPM = int(os.environ.get("ISHAI_CHAT_TPM", "90000"))
+EMBEDDING_RPM = int(os.environ.get("ISHAI_EMBEDDING_RPM", "3000"))
+EMBEDDING_TPM = int(os.environ.get("ISHAI_EMBEDDING_TPM", "1000000"))
+RATE_LIMIT_DB = os.environ.get("ISHAI_RATE_LIMIT_DB", "")
@@ -0,0 +1,160 @@
+import logging
+import re
+from functools import lru_cache
+
+import tiktoken
+
+import config
+from financial_tables import extract_tables
+
+logger = logging.getLogger(__name__)
+
+# Répartition du budget de contexte entre les différentes sources
+USER_TEXT_SHARE = 0.4
+RETRIEVAL_SHARE = 0.3
+
+
+class ApproximateEncoding:
+    # Repli lorsque tiktoken ne peut pas télécharger ses tables (machine sans réseau) :
+    # mots découpés par blocs de 4 caractères, ponctuation et espaces, soit l'ordre de grandeur du BPE
+    PATTERN = re.compile(r"\s*\w{1,4}|\s*[^\w\s]|\s+")
+
+    def encode(self, text):
+        return self.PATTERN.findall(text)
+
+    def decode(self, tokens):
+        return "".join(tokens)
+
+
+@lru_cache(maxsize=None)
+def get_encoding(model):
+    try:
+        try:
+            return tiktoken.encoding_for_model(model)
+        except KeyError:
+            return tiktoken.get_encoding("cl100k_base")
+    except Exception as e:
+        logger.warning("Encodage tiktoken indisponible (%s) : comptage approximatif des jetons", e)
+        return ApproximateEncoding()
+
+
+def count_tokens(text, model=config.CHAT_MODEL):
+    return len(get_encoding(model).encode(text)) if text else 0
+
+
+def count_message_tokens(messages, model=config.CHAT_MODEL):
+    # Estimation du format chat : quelques jetons de structure par message et pour l'amorce de réponse
+    return sum(4 + count_tokens(message["content"], model) for message in messages) + 3
+
+
+def truncate_to_tokens(text, max_tokens, model=config.CHAT_MODEL):
+    if max_tokens <= 0:
+        return ""
+    tokens = get_encoding(model).encode(text)
+    if len(tokens) <= max_tokens:
+        return text
+    return get_encoding(model).decode(tokens[:max_tokens])
+
+
+def _table_totals(rows):
+    # Un tableau chiffré est remplacé par ses totaux calculés localement (financial_tables)
+    return [
+        "Totaux du tableau : " + ", ".join(f"{table.header[index]} {total:,.2f}" for index, total in table.totals.items())
+        for table in extract_tables({"": "\n".join(rows)})
+    ]
+
+
+def summarize(text, max_tokens, model=config.CHAT_MODEL):
+    # Résumé extractif (sans appel au LLM) : titres, première phrase de chaque paragraphe
+    # et totaux des tableaux chiffrés
+    if count_tokens(text, model) <= max_tokens:
+        return text
+    lines = []
+    table = []
+    for paragraph in text.split("\n") + [""]:
+        paragraph = paragraph.strip()
+        if paragraph.startswith("|"):
+            table.append(paragraph)
+            continue
+        if table:
+            lines.extend(_table_totals(table))
+            table = []
+        if not paragraph:
+            continue
+        if paragraph.startswith("#"):
+            lines.append(paragraph)
+        else:
+            lines.append(re.split(r"(?<=[.!?])\s", paragraph, maxsplit=1)[0])
+    return truncate_to_tokens("\n".join(lines), max_tokens, model)
+
+
+def section_budget(system_tokens, completion_tokens=None):
+    # Budget du message utilisateur : fenêtre du modèle moins le prompt système (compté au chargement
+    # des modèles) et la réponse attendue (max_tokens de la route de la section, sinon la réserve par défaut)
+    available = config.MODEL_CONTEXT_WINDOW - system_tokens - (completion_tokens or config.COMPLETION_TOKEN_RESERVE)
+    return max(0, min(config.CONTEXT_TOKEN_BUDGET, available))
+
+
+def _fit_chunks(chunks, max_tokens, model):
+    # Les extraits sont déjà classés par pertinence : on garde les meilleurs qui tiennent dans le budget
+    kept, used = [], 0
+    for chunk in chunks:
+        tokens = count_tokens(chunk, model)
+        if used + tokens > max_tokens:
+            if not kept:
+                kept.append(truncate_to_tokens(chunk, max_tokens, model))
+                used = max_tokens
+            break
+        kept.append(chunk)
+        used += tokens
+    return kept, used
+
+
+def build_context(user_text, upstream, retrieved, query, budget, model=config.CHAT_MODEL):
+    # upstream : {nom de section: texte}, retrieved : extraits classés par pertinence
+    query_tokens = count_tokens(query, model)
+    remaining = max(0, budget - query_tokens)
+
+    user_cap = int(remaining * USER_TEXT_SHARE)
+    retrieval_cap = int(remaining * RETRIEVAL_SHARE)
+    user_tokens = count_tokens(user_text, model)
+    retrieval_tokens = sum(count_tokens(chunk, model) for chunk in retrieved)
+    upstream_tokens = sum(count_tokens(text, model) for text in upstream.values())
+
+    # Le budget non utilisé par une source est redistribué aux autres
+    upstream_cap = remaining - min(user_tokens, user_cap) - min(retrieval_tokens, retrieval_cap)
+    if upstream_tokens < upstream_cap:
+        spare = upstream_cap - upstream_tokens
+        upstream_cap = upstream_tokens
+        extra_user = min(spare, max(0, user_tokens - user_cap))
+        user_cap += extra_user
+        retrieval_cap += spare - extra_user
+
+    user_part = truncate_to_tokens(user_text, user_cap, model)
+    chunks, retrieval_used = _fit_chunks(retrieved, retrieval_cap, model)
+
+    summaries = []
+    if upstream:
+        per_section = upstream_cap // len(upstream)
+        for name, text in upstream.items():
+            header = f"{name}:\n"
+            summaries.append(header + summarize(text, per_section - count_tokens(header, model), model))
+
+    # Les résumés extractifs sont souvent plus courts que leur part : le reste revient au texte de l'utilisateur
+    summaries_used = sum(count_tokens(summary, model) for summary in summaries)
+    leftover = remaining - count_tokens(user_part, model) - retrieval_used - summaries_used
+    if leftover > 0 and user_part != user_text:
+        user_part = truncate_to_tokens(user_text, user_cap + leftover, model)
+
+    parts = [part for part in [user_part] + summaries + chunks + [query] if part]
+    content = " ".join(parts)
+    report = {
+        "budget": budget,
+        "user_text": count_tokens(user_part, model),
+        "upstream": summaries_used,
+        "retrieval": retrieval_used,
+        "query": query_tokens,
+        "total": count_tokens(content, model),
+        "truncated": user_part != user_text or len(chunks) < len(retrieved) or upstream_tokens > upstream_cap,
+    }
+    return content, report
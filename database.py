@@ -0,0 +1,20 @@
+import sqlite3
+from contextlib import contextmanager
+
+# Connexion aux bases SQLite locales (tâches, caches, limiteur de débit partagé) : mode WAL pour
+# les lectures concurrentes entre workers, attente des verrous plutôt qu'une erreur immédiate
+
+
+@contextmanager
+def connect(path, row_factory=None, autocommit=False):
+    # Transaction validée à la sortie du bloc, annulée en cas d'exception ; en mode autocommit,
+    # l'appelant ouvre lui-même ses transactions (ex. BEGIN IMMEDIATE)
+    conn = sqlite3.connect(path, timeout=30, isolation_level=None if autocommit else "")
+    if row_factory is not None:
+        conn.row_factory = row_factory
+    conn.execute("PRAGMA journal_mode=WAL")
+    try:
+        with conn:
+            yield conn
+    finally:
+        conn.close()
@@ -0,0 +1,158 @@
+import hashlib
+import os
+import re
+import threading
+import unicodedata
+
+import numpy as np
+from langchain.embeddings.base import Embeddings
+
+import config
+import metrics
+from context_builder import count_tokens
+from database import connect
+from rate_limiter import Coalescer, get_limiter
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS vectors (key TEXT PRIMARY KEY, row INTEGER NOT NULL);
+CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value INTEGER NOT NULL);
+"""
+
+
+def normalize(text):
+    # Les variantes d'espaces ou de forme Unicode d'un même texte partagent un vecteur
+    return re.sub(r"\s+", " ", unicodedata.normalize("NFC", text)).strip()
+
+
+def text_key(text, model):
+    return hashlib.sha256(f"{model}\0{text}".encode("utf-8")).hexdigest()
+
+
+class EmbeddingStore:
+    # Vecteurs float32 contigus dans un fichier mappé en mémoire, indexés par empreinte du texte
+
+    def __init__(self, directory):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        self.vectors_path = os.path.join(directory, "vectors.f32")
+        self.db_path = os.path.join(directory, "index.sqlite3")
+        self._lock = threading.Lock()
+        self._mmap = None
+        with connect(self.db_path) as conn:
+            conn.executescript(SCHEMA)
+
+    def _dimension(self, conn):
+        row = conn.execute("SELECT value FROM meta WHERE name = 'dimension'").fetchone()
+        return row[0] if row else None
+
+    def _rows(self, dimension, rows):
+        # Seules les lignes validées (meta.rows) sont mappées : un autre processus peut être en train
+        # d'écrire la suite du fichier. Le fichier ne fait que grandir : on le remappe lorsqu'il a
+        # de nouvelles lignes validées.
+        if self._mmap is None or self._mmap.shape[0] < rows:
+            self._mmap = np.memmap(self.vectors_path, dtype=np.float32, mode="r", shape=(rows, dimension))
+        return self._mmap
+
+    def get_many(self, keys):
+        if not keys:
+            return {}
+        found = {}
+        with connect(self.db_path) as conn:
+            # Une seule transaction de lecture : les clés trouvées et le nombre de lignes validées
+            # viennent du même état de la base
+            conn.execute("BEGIN")
+            dimension = self._dimension(conn)
+            if dimension is None:
+                return {}
+            rows = conn.execute("SELECT value FROM meta WHERE name = 'rows'").fetchone()[0]
+            for start in range(0, len(keys), 500):
+                batch = keys[start:start + 500]
+                placeholders = ", ".join("?" for _ in batch)
+                found.update(conn.execute(f"SELECT key, row FROM vectors WHERE key IN ({placeholders})", batch).fetchall())
+        if not found:
+            return {}
+        with self._lock:
+            matrix = self._rows(dimension, rows)
+            return {key: matrix[row].tolist() for key, row in found.items()}
+
+    def put_many(self, items):
+        # items : {clé: vecteur}
+        if not items:
+            return
+        vectors = np.asarray(list(items.values()), dtype=np.float32)
+        with self._lock, connect(self.db_path) as conn:
+            # Réservation des lignes dans une transaction : plusieurs processus peuvent écrire
+            conn.execute("BEGIN IMMEDIATE")
+            dimension = self._dimension(conn)
+            if dimension is None:
+                dimension = vectors.shape[1]
+                conn.execute("INSERT INTO meta (name, value) VALUES ('dimension', ?)", (dimension,))
+            row = conn.execute("SELECT value FROM meta WHERE name = 'rows'").fetchone()
+            first_row = row[0] if row else 0
+            conn.execute("INSERT OR REPLACE INTO meta (name, value) VALUES ('rows', ?)", (first_row + len(vectors),))
+            fd = os.open(self.vectors_path, os.O_WRONLY | os.O_CREAT, 0o644)
+            try:
+                os.pwrite(fd, vectors.tobytes(), first_row * dimension * 4)
+            finally:
+                os.close(fd)
+            # Les clés ne sont visibles qu'une fois les vecteurs écrits
+            conn.executemany(
+                "INSERT OR IGNORE INTO vectors (key, row) VALUES (?, ?)",
+                [(key, first_row + i) for i, key in enumerate(items)],
+            )
+
+
+_coalescer = Coalescer()
+
+
+class CachedEmbeddings(Embeddings):
+    # N'envoie à l'API que les textes jamais vus, dédupliqués et regroupés en grands lots
+
+    def __init__(self, embeddings, model, directory=None):
+        self.embeddings = embeddings
+        self.model = model
+        safe_model = re.sub(r"[^\w.-]", "_", model)
+        self.store = EmbeddingStore(directory or os.path.join(config.EMBEDDING_CACHE_DIR, safe_model))
+        self.hits = 0
+        self.misses = 0
+
+    def embed_documents(self, texts):
+        with metrics.span("embed", texts=len(texts)) as attributes:
+            vectors = self._embed_documents(texts, attributes)
+        return vectors
+
+    def _embed_documents(self, texts, attributes):
+        normalized = [normalize(text) for text in texts]
+        keys = [text_key(text, self.model) for text in normalized]
+        cached = self.store.get_many(list(set(keys)))
+
+        missing = {}
+        for key, text in zip(keys, normalized):
+            if key not in cached and key not in missing:
+                missing[key] = text
+        self.hits += len(keys) - len(missing)
+        self.misses += len(missing)
+        attributes.update(hits=len(keys) - len(missing), misses=len(missing))
+        metrics.count("embedding_cache", len(keys) - len(missing), result="hit")
+        metrics.count("embedding_cache", len(missing), result="miss")
+
+        missing_keys = list(missing)
+        for start in range(0, len(missing_keys), config.EMBEDDING_BATCH_SIZE):
+            batch = missing_keys[start:start + config.EMBEDDING_BATCH_SIZE]
+            # Lot identique déjà en cours (même document indexé par une autre session) : résultat partagé
+            vectors, _ = _coalescer.run(
+                hashlib.sha256("".join(batch).encode("utf-8")).hexdigest(),
+                lambda: self._fetch([missing[key] for key in batch]),
+            )
+            new_items = dict(zip(batch, vectors))
+            self.store.put_many(new_items)
+            cached.update(new_items)
+
+        return [list(cached[key]) for key in keys]
+
+    def _fetch(self, texts):
+        get_limiter("embeddings").acquire(sum(count_tokens(text) for text in texts))
+        return self.embeddings.embed_documents(texts)
+
+    def embed_query(self, text):
+        return self.embed_documents([text])[0]
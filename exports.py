@@ -0,0 +1,171 @@
+import hashlib
+import json
+import multiprocessing
+import os
+import tempfile
+import threading
+import time
+from collections import namedtuple
+from concurrent.futures import Future, ProcessPoolExecutor
+from io import BytesIO
+
+import config
+import metrics
+
+# Formats d'export enregistrés : chaque rendu transforme le Markdown du business plan en octets.
+# Un nouveau format s'ajoute avec @register_exporter, sans modifier l'interface.
+
+Exporter = namedtuple("Exporter", ["name", "label", "file_name", "mime", "render"])
+
+EXPORTERS = {}
+
+
+def register_exporter(name, label, file_name, mime):
+    def decorator(render):
+        EXPORTERS[name] = Exporter(name, label, file_name, mime, render)
+        return render
+    return decorator
+
+
+@register_exporter("pdf", "le PDF", "business_plan.pdf", "application/pdf")
+def render_pdf(markdown_content, meta):
+    from markdown_pdf import MarkdownPdf, Section
+
+    pdf = MarkdownPdf(toc_level=2)
+    pdf.add_section(Section(markdown_content))
+    pdf.meta["title"] = meta.get("title", "Business Plan")
+    pdf.meta["author"] = meta.get("author", "")
+    # Rendu en mémoire pour ne pas partager de fichier entre les sessions
+    pdf_buffer = BytesIO()
+    pdf.save(pdf_buffer)
+    return pdf_buffer.getvalue()
+
+
+@register_exporter("docx", "le document Word", "business_plan.docx", "application/vnd.openxmlformats-officedocument.wordprocessingml.document")
+def render_docx(markdown_content, meta):
+    from markdown_docx import markdown_to_docx
+
+    return markdown_to_docx(markdown_content, default_title=meta.get("title", "Business Plan")).getvalue()
+
+
+@register_exporter("html", "la page HTML", "business_plan.html", "text/html")
+def render_html(markdown_content, meta):
+    from html import escape
+
+    from markdown_it import MarkdownIt
+
+    # Le HTML brut (réponse du modèle, PDF ou texte du candidat) est échappé, jamais recopié dans la page
+    body = MarkdownIt("commonmark", {"html": False}).enable("table").render(markdown_content)
+    return (
+        "<!DOCTYPE html>\n<html lang=\"fr\">\n<head>\n<meta charset=\"utf-8\">\n"
+        f"<title>{escape(meta.get('title', 'Business Plan'))}</title>\n"
+        f"<meta name=\"author\" content=\"{escape(meta.get('author', ''))}\">\n"
+        "<style>body{font-family:sans-serif;max-width:60em;margin:auto}"
+        "table{border-collapse:collapse}td,th{border:1px solid #999;padding:.3em}</style>\n"
+        f"</head>\n<body>\n{body}</body>\n</html>\n"
+    ).encode("utf-8")
+
+
+@register_exporter("xlsx", "le classeur Excel", "business_plan.xlsx", "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet")
+def render_xlsx(markdown_content, meta):
+    from financial_tables import extract_tables, split_sections, tables_to_xlsx
+
+    # Tableaux chiffrés des sections, une feuille par tableau et une synthèse des totaux
+    return tables_to_xlsx(extract_tables(split_sections(markdown_content)), title=meta.get("title", "Business Plan"))
+
+
+def content_hash(markdown_content, meta):
+    payload = json.dumps([markdown_content, meta], ensure_ascii=False, sort_keys=True)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def purge(retention, directory=config.EXPORT_CACHE_DIR):
+    # Supprime les documents rendus il y a plus de retention secondes, puis les répertoires vides
+    cutoff = time.time() - retention
+    removed = 0
+    try:
+        digests = os.listdir(directory)
+    except FileNotFoundError:
+        return 0
+    for digest in digests:
+        folder = os.path.join(directory, digest)
+        try:
+            for name in os.listdir(folder):
+                path = os.path.join(folder, name)
+                if os.path.getmtime(path) < cutoff:
+                    os.remove(path)
+                    removed += 1
+            if not os.listdir(folder):
+                os.rmdir(folder)
+        except OSError:
+            continue
+    return removed
+
+
+class ExportService:
+    # Rendu à la demande dans un pool de processus, avec cache disque par empreinte du Markdown
+    # et fusion des demandes identiques en cours
+
+    def __init__(self, directory=config.EXPORT_CACHE_DIR, max_workers=None):
+        self.directory = directory
+        self.max_workers = max_workers or config.EXPORT_WORKERS
+        self._executor = None
+        self._in_flight = {}
+        self._lock = threading.Lock()
+
+    def _get_executor(self):
+        # "spawn" évite de dupliquer par fork un processus qui fait tourner des threads
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.max_workers,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+        return self._executor
+
+    def _path(self, digest, exporter):
+        return os.path.join(self.directory, digest, exporter.file_name)
+
+    def _store(self, path, future):
+        if future.exception() is not None:
+            return
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+        with os.fdopen(fd, "wb") as f:
+            f.write(future.result())
+        os.replace(tmp_path, path)
+
+    def request(self, name, markdown_content, meta, trace=None):
+        # Renvoie un Future ; le rendu n'est lancé que si le format n'est ni en cache ni déjà en cours.
+        # La durée du rendu (attente du pool comprise) est enregistrée dans trace si fournie.
+        exporter = EXPORTERS[name]
+        digest = content_hash(markdown_content, meta)
+        path = self._path(digest, exporter)
+        started = time.perf_counter()
+        with self._lock:
+            future = self._in_flight.get((digest, name))
+            if future is not None:
+                return future
+            if os.path.exists(path):
+                future = Future()
+                with open(path, "rb") as f:
+                    future.set_result(f.read())
+                metrics.record(f"render_{name}", time.perf_counter() - started, trace=trace, cached=True)
+                return future
+            future = self._get_executor().submit(exporter.render, markdown_content, meta)
+            self._in_flight[(digest, name)] = future
+
+        def done(completed):
+            attributes = {"cached": False}
+            if completed.exception() is not None:
+                attributes["error"] = type(completed.exception()).__name__
+            metrics.record(f"render_{name}", time.perf_counter() - started, trace=trace, **attributes)
+            self._store(path, completed)
+            with self._lock:
+                self._in_flight.pop((digest, name), None)
+        future.add_done_callback(done)
+        return future
+
+    def render(self, names, markdown_content, meta, trace=None):
+        # Plusieurs formats rendus en parallèle : {nom: octets}
+        futures = {name: self.request(name, markdown_content, meta, trace) for name in names}
+        return {name: future.result() for name, future in futures.items()}
@@ -0,0 +1,240 @@
+import re
+from collections import namedtuple
+from io import BytesIO
+
+from markdown_blocks import tokenize
+
+# Extraction des tableaux chiffrés des sections : montants typés, validés et totalisés localement
+# (le modèle n'a jamais à faire d'arithmétique)
+
+AMOUNT_HEADER = re.compile(r"montant|budget|co[uû]t total|\$|usd|€|eur\b", re.IGNORECASE)
+CURRENCY = re.compile(r"\$|€|\busd\b|\beur\b", re.IGNORECASE)
+# Colonnes chiffrées qui ne sont pas des montants
+COUNT_HEADER = re.compile(r"quantit|nombre|qt[ée]|unit[ée]s|effectif|%|taux|ann[ée]e\s*$", re.IGNORECASE)
+# Signe moins seulement en début de cellule ou après une espace : « 1 500-2 000 » est une fourchette
+NUMBER = re.compile(r"(?:(?<!\S)-)?\d(?:[\d.,'\u00a0\u202f]|\s(?=\d{3}(?!\d)))*")
+RANGE = re.compile(r"(?<=\d)\s*[-–—]\s*(?=-?\d)")
+TOTAL_LABEL = re.compile(r"^\W*(sous-)?total\b", re.IGNORECASE)
+PLACEHOLDER_LABEL = re.compile(r"^\W*(…|\.\.\.)\s*à compléter", re.IGNORECASE)
+EMPTY_VALUES = {"", "-", "–", "—", "n/a", "na", "nd", "néant", "/"}
+SHEET_NAME_FORBIDDEN = re.compile(r"[\[\]:*?/\\]")
+
+FinancialTable = namedtuple("FinancialTable", ["section", "title", "header", "rows", "amounts", "totals", "warnings"])
+
+
+def _to_float(number):
+    number = re.sub(r"[\s'\u00a0\u202f]", "", number)
+    if "," in number and "." in number:
+        # Le dernier séparateur est le séparateur décimal
+        if number.rfind(",") > number.rfind("."):
+            number = number.replace(".", "").replace(",", ".")
+        else:
+            number = number.replace(",", "")
+    elif "," in number:
+        # « 0,500 » est un décimal : un séparateur de milliers ne suit jamais un zéro seul
+        number = number.replace(",", "") if re.fullmatch(r"-?[1-9]\d{0,2}(,\d{3})+", number) else number.replace(",", ".")
+    elif re.fullmatch(r"-?[1-9]\d{0,2}(\.\d{3})+", number):
+        number = number.replace(".", "")
+    return float(number.rstrip(".,"))
+
+
+def parse_amounts(text):
+    # Tous les montants d'une cellule ("1 500 US $", "2,500.50", "500 / 6 000", "1 500-2 000")
+    text = text.replace("*", "").strip()
+    if text.lower() in EMPTY_VALUES or "%" in text:
+        return []
+    # Le tiret d'une fourchette sépare deux montants positifs
+    text = RANGE.sub(" / ", text)
+    return [_to_float(match.group().strip()) for match in NUMBER.finditer(text)]
+
+
+def _cell_value(text, header):
+    # Renvoie (montant ou None, avertissement ou None)
+    try:
+        amounts = parse_amounts(text)
+    except ValueError:
+        return None, f"montant illisible « {text} »"
+    if not amounts:
+        return None, (f"montant illisible « {text} »" if text.strip().lower() not in EMPTY_VALUES else None)
+    if RANGE.search(text):
+        return None, f"fourchette « {text} » : montant à préciser"
+    if len(amounts) == 1:
+        return amounts[0], None
+    # Colonnes « mensuels et annuels » : on retient le montant annuel, donné en dernier
+    if "annuel" in header.lower():
+        return amounts[-1], None
+    return None, f"plusieurs montants dans « {text} »"
+
+
+def _is_amount_cell(text):
+    if CURRENCY.search(text):
+        return True
+    try:
+        return len(parse_amounts(text)) == 1
+    except ValueError:
+        return False
+
+
+def _amount_columns(header, body):
+    # La première colonne porte le libellé de la ligne. Une colonne est un montant si son en-tête
+    # l'annonce, ou si la plupart de ses cellules sont des montants (ex. budget mensuel
+    # « Janvier | Février | Mars » avec la devise dans les cellules)
+    rows = [row for row in body if not TOTAL_LABEL.match(row[0].replace("*", "").strip())] if body else []
+    columns = []
+    for index, name in enumerate(header):
+        if index == 0:
+            continue
+        if AMOUNT_HEADER.search(name):
+            columns.append(index)
+            continue
+        if COUNT_HEADER.search(name):
+            continue
+        cells = [row[index] for row in rows if index < len(row) and row[index].strip().lower() not in EMPTY_VALUES]
+        if cells and sum(_is_amount_cell(cell) for cell in cells) > len(cells) / 2:
+            columns.append(index)
+    return columns
+
+
+def _build_table(section, title, rows):
+    header, body = rows[0], rows[1:]
+    amount_columns = _amount_columns(header, body)
+    if not amount_columns:
+        return None
+
+    kept, amounts, warnings = [], [], []
+    stated_totals = {}
+    for row in body:
+        row = row + [""] * (len(header) - len(row))
+        label = row[0].replace("*", "").strip()
+        if PLACEHOLDER_LABEL.match(label):
+            continue
+        values = {}
+        for index in amount_columns:
+            value, warning = _cell_value(row[index], header[index])
+            if warning:
+                warnings.append(f"{label or 'ligne sans libellé'} : {warning}")
+            elif value is not None and value < 0:
+                warnings.append(f"{label} : montant négatif ({value:g})")
+            values[index] = value
+        if TOTAL_LABEL.match(label):
+            # Le total annoncé par le modèle sert uniquement de contrôle
+            stated_totals.update({index: value for index, value in values.items() if value is not None})
+            continue
+        kept.append(row)
+        amounts.append(values)
+
+    totals = {index: sum(values[index] or 0.0 for values in amounts) for index in amount_columns}
+    for index, stated in stated_totals.items():
+        if abs(stated - totals[index]) > max(1.0, abs(totals[index]) * 0.005):
+            warnings.append(f"total annoncé pour « {header[index]} » ({stated:,.2f}) différent du total calculé ({totals[index]:,.2f})")
+    return FinancialTable(section, title, header, kept, amounts, totals, warnings)
+
+
+def extract_tables(results):
+    # results : {nom de section: contenu Markdown} → tableaux comportant au moins une colonne de montants
+    tables = []
+    for section, content in results.items():
+        title = section
+        for kind, data in tokenize(content):
+            if kind == "heading":
+                title = data[1]
+            elif kind == "paragraph":
+                # La phrase qui précède un tableau lui sert souvent de titre
+                title = data.replace("*", "").rstrip(" :")
+            elif kind == "table" and len(data) > 1:
+                table = _build_table(section, title, data)
+                if table is not None:
+                    tables.append(table)
+    return tables
+
+
+def split_sections(markdown_content):
+    # Inverse de pipeline.generate_markdown : {titre de niveau 2: contenu}
+    sections = {}
+    name = None
+    lines = []
+    for line in markdown_content.split("\n"):
+        if line.startswith("## "):
+            if name is not None:
+                sections[name] = "\n".join(lines)
+            name, lines = line[3:].strip(), []
+        elif name is not None:
+            lines.append(line)
+    if name is not None:
+        sections[name] = "\n".join(lines)
+    return sections
+
+
+def _sheet_name(base, used):
+    base = SHEET_NAME_FORBIDDEN.sub(" ", base).strip()[:28] or "Tableau"
+    name, counter = base, 2
+    while name.lower() in used:
+        name = f"{base[:26]} {counter}"
+        counter += 1
+    used.add(name.lower())
+    return name
+
+
+def tables_to_xlsx(tables, title="Business Plan"):
+    import xlsxwriter
+
+    buffer = BytesIO()
+    workbook = xlsxwriter.Workbook(buffer, {"in_memory": True})
+    bold = workbook.add_format({"bold": True})
+    header_format = workbook.add_format({"bold": True, "bg_color": "#D9E1F2", "border": 1, "text_wrap": True})
+    money = workbook.add_format({"num_format": "#,##0.00", "border": 1})
+    text = workbook.add_format({"border": 1, "text_wrap": True, "valign": "top"})
+    total_money = workbook.add_format({"num_format": "#,##0.00", "bold": True, "top": 2})
+    total_text = workbook.add_format({"bold": True, "top": 2})
+
+    # Feuille de synthèse : un total par colonne de montants et les anomalies relevées
+    summary = workbook.add_worksheet("Synthèse")
+    summary.write(0, 0, title, bold)
+    summary.write_row(2, 0, ["Section", "Tableau", "Colonne", "Total calculé", "Feuille", "Contrôles"], header_format)
+    summary.set_column(0, 1, 35)
+    summary.set_column(2, 2, 30)
+    summary.set_column(3, 3, 16)
+    summary.set_column(4, 4, 20)
+    summary.set_column(5, 5, 60)
+
+    used = {"synthèse"}
+    summary_row = 3
+    for table in tables:
+        sheet_name = _sheet_name(f"{table.section[:20]} - {table.title[:20]}" if table.title != table.section else table.section, used)
+        sheet = workbook.add_worksheet(sheet_name)
+        sheet.write(0, 0, f"{table.section} — {table.title}", bold)
+        sheet.write_row(2, 0, table.header, header_format)
+        for index in range(len(table.header)):
+            sheet.set_column(index, index, 16 if index in table.totals else 40)
+
+        first_row = 3
+        for offset, (row, values) in enumerate(zip(table.rows, table.amounts)):
+            for index, cell in enumerate(row[:len(table.header)]):
+                if index in values and values[index] is not None:
+                    sheet.write_number(first_row + offset, index, values[index], money)
+                else:
+                    sheet.write_string(first_row + offset, index, cell.replace("**", ""), text)
+        total_row = first_row + len(table.rows)
+        sheet.write(total_row, 0, "Total", total_text)
+        for index, total in table.totals.items():
+            # Formule recalculable par l'analyste, avec la valeur calculée localement en cache
+            column = xlsxwriter.utility.xl_col_to_name(index)
+            if table.rows:
+                sheet.write_formula(total_row, index, f"=SUM({column}{first_row + 1}:{column}{total_row})", total_money, total)
+            else:
+                sheet.write_number(total_row, index, total, total_money)
+
+            summary.write_row(summary_row, 0, [table.section, table.title, table.header[index]])
+            summary.write_number(summary_row, 3, total, money)
+            summary.write_url(summary_row, 4, f"internal:'{sheet_name}'!A1", string=sheet_name)
+            summary.write_string(summary_row, 5, " ; ".join(table.warnings) or "OK")
+            summary_row += 1
+        if table.warnings:
+            sheet.write(total_row + 2, 0, "Contrôles", bold)
+            for offset, warning in enumerate(table.warnings):
+                sheet.write_string(total_row + 3 + offset, 0, warning)
+
+    if not tables:
+        summary.write(3, 0, "Aucun tableau chiffré n'a été trouvé dans le business plan.")
+    workbook.close()
+    return buffer.getvalue()
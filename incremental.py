@@ -0,0 +1,76 @@
+import hashlib
+import re
+
+import numpy as np
+
+import config
+from context_builder import count_tokens
+
+# Régénération incrémentale : chaque section enregistre les entrées qu'elle a consommées
+# (fragments du texte de l'utilisateur, sections amont, consignes et document) ; lors d'une
+# nouvelle version du texte, seules les sections dont ces entrées ont réellement changé
+# sont régénérées.
+
+
+def split_fragments(text):
+    # Un fragment par paragraphe
+    return [fragment.strip() for fragment in re.split(r"\n\s*\n", text or "") if fragment.strip()]
+
+
+def digest(text):
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def consumed_fragments(user_text, user_tokens):
+    # Fragments inclus dans le contexte : le texte est tronqué par la fin au budget de la section ;
+    # un fragment partiellement inclus compte en entier
+    fragments, used = [], 0
+    for fragment in split_fragments(user_text):
+        if used >= user_tokens:
+            break
+        fragments.append(fragment)
+        used += count_tokens(fragment)
+    return fragments
+
+
+def section_inputs(context_key, user_text, user_tokens, upstream):
+    # upstream : {nom: entrée} des sections dont celle-ci dépend
+    return {
+        "context": context_key,
+        "user_tokens": user_tokens,
+        "fragments": consumed_fragments(user_text, user_tokens),
+        "upstream": {name: digest(entry["content"]) for name, entry in upstream.items()},
+    }
+
+
+def _similarities(embeddings, left, right):
+    vectors = np.asarray(embeddings.embed_documents(left + right), dtype=np.float32)
+    vectors /= np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+    return (vectors[:len(left)] * vectors[len(left):]).sum(axis=1)
+
+
+def material_change(inputs, context_key, user_text, upstream, embeddings, threshold=None):
+    # Renvoie None si la section peut être réutilisée, sinon la raison de sa régénération
+    threshold = config.INCREMENTAL_SIMILARITY if threshold is None else threshold
+    if not inputs or inputs["context"] != context_key:
+        return "consignes, modèle ou document modifiés"
+    current_upstream = {name: digest(entry["content"]) for name, entry in upstream.items()}
+    for name in set(current_upstream) | set(inputs["upstream"]):
+        if current_upstream.get(name) != inputs["upstream"].get(name):
+            return f"section {name} modifiée"
+
+    previous = inputs["fragments"]
+    current = consumed_fragments(user_text, inputs["user_tokens"])
+    previous_hashes = {digest(fragment) for fragment in previous}
+    current_hashes = {digest(fragment) for fragment in current}
+    added = [fragment for fragment in current if digest(fragment) not in previous_hashes]
+    removed = [fragment for fragment in previous if digest(fragment) not in current_hashes]
+    if not added and not removed:
+        return None
+    if len(added) != len(removed):
+        return "paragraphes ajoutés ou supprimés"
+    # Paragraphes modifiés, appariés dans l'ordre : une faute corrigée reste très proche
+    for fragment, similarity in zip(added, _similarities(embeddings, added, removed)):
+        if similarity < threshold:
+            return f"paragraphe modifié : « {fragment[:60]} »"
+    return None
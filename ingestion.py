@@ -0,0 +1,101 @@
+import logging
+import multiprocessing
+import os
+import tempfile
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from io import BytesIO
+from itertools import repeat
+
+import config
+import metrics
+
+logger = logging.getLogger(__name__)
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def _get_pool():
+    # Pool de processus partagé, créé à la première ingestion d'un gros document.
+    # "spawn" évite de dupliquer par fork un processus qui fait tourner des threads.
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(
+                max_workers=config.INGESTION_WORKERS,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+        return _pool
+
+
+def open_pdf(pdf_bytes):
+    from pypdf import PdfReader
+
+    # Vérifie les limites de taille avant tout traitement coûteux
+    if len(pdf_bytes) > config.MAX_PDF_BYTES:
+        raise ValueError(f"Le fichier PDF dépasse la taille maximale autorisée ({config.MAX_PDF_BYTES // (1024 * 1024)} Mo).")
+    reader = PdfReader(BytesIO(pdf_bytes))
+    if len(reader.pages) > config.MAX_PDF_PAGES:
+        raise ValueError(f"Le fichier PDF dépasse le nombre maximal de pages autorisé ({config.MAX_PDF_PAGES}).")
+    return reader
+
+
+def _split_pages(reader, start, stop, source):
+    from langchain.text_splitter import RecursiveCharacterTextSplitter
+
+    text_splitter = RecursiveCharacterTextSplitter(chunk_size=config.CHUNK_SIZE, chunk_overlap=config.CHUNK_OVERLAP)
+    chunks = []
+    for page_number in range(start, stop):
+        text = reader.pages[page_number].extract_text() or ""
+        for chunk in text_splitter.split_text(text):
+            chunks.append((chunk, {"source": source, "page": page_number}))
+    return chunks
+
+
+def _extract_range(path, start, stop, source):
+    # Exécuté dans un processus du pool : chaque worker ne lit que ses pages
+    from pypdf import PdfReader
+
+    return _split_pages(PdfReader(path), start, stop, source)
+
+
+def iter_chunk_batches(pdf_bytes, source="document.pdf", stats=None):
+    # Produit les extraits (texte, métadonnées) par lots de pages, dans l'ordre des pages,
+    # dès qu'ils sont prêts : l'indexation peut commencer avant la fin de l'extraction.
+    started = time.perf_counter()
+    with metrics.span("pdf_load", bytes=len(pdf_bytes)) as attributes:
+        reader = open_pdf(pdf_bytes)
+        attributes["pages"] = len(reader.pages)
+    page_count = len(reader.pages)
+    step = config.INGESTION_PAGES_PER_TASK
+    starts = list(range(0, page_count, step))
+    stops = [min(start + step, page_count) for start in starts]
+
+    tmp_path = None
+    if page_count < config.INGESTION_PARALLEL_MIN_PAGES or config.INGESTION_WORKERS <= 1:
+        batches = (_split_pages(reader, start, stop, source) for start, stop in zip(starts, stops))
+    else:
+        # Fichier temporaire propre à cette ingestion, lu par les workers puis supprimé
+        fd, tmp_path = tempfile.mkstemp(suffix=".pdf")
+        with os.fdopen(fd, "wb") as f:
+            f.write(pdf_bytes)
+        batches = _get_pool().map(_extract_range, repeat(tmp_path), starts, stops, repeat(source))
+
+    try:
+        batches = iter(batches)
+        for start, stop in zip(starts, stops):
+            # Temps d'attente de chaque lot (extraction et découpage, en parallèle ou non)
+            waited = time.perf_counter()
+            batch = next(batches)
+            metrics.record("split", time.perf_counter() - waited, pages=stop - start, chunks=len(batch))
+            yield batch
+    finally:
+        if tmp_path:
+            os.remove(tmp_path)
+        elapsed = time.perf_counter() - started
+        pages_per_second = page_count / elapsed if elapsed > 0 else 0.0
+        if stats is not None:
+            stats.update(pages=page_count, seconds=elapsed, pages_per_second=pages_per_second)
+        logger.info("Ingestion de %s : %d pages en %.2f s (%.1f pages/s)", source, page_count, elapsed, pages_per_second)
@@ -0,0 +1,345 @@
+import hashlib
+import json
+import os
+import shutil
+import sqlite3
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+import config
+import exports
+import metrics
+import pipeline
+from database import connect
+from ingestion import open_pdf
+from resources import ResourcePool, entry_size, get_manager
+from section_cache import SectionCache
+from semantic_cache import SemanticCache
+
+# Statuts d'une tâche de génération
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+# Plan assemblé mais avec des sections en erreur (ex. 429 persistant) : jamais réutilisé
+# par submit, une nouvelle soumission régénère les sections manquantes
+PARTIAL = "partial"
+
+# Tâches terminées, supprimées après config.JOB_RETENTION
+FINISHED = (DONE, FAILED, PARTIAL)
+
+# Les formats de téléchargement sont rendus à la demande par exports.ExportService
+ARTIFACTS = {
+    "markdown": "business_plan.md",
+    "meta": "meta.json",
+}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    input_key TEXT NOT NULL,
+    status TEXT NOT NULL,
+    stage TEXT,
+    source TEXT,
+    user_text TEXT NOT NULL,
+    regenerate TEXT NOT NULL DEFAULT '[]',
+    sections TEXT NOT NULL DEFAULT '{}',
+    error TEXT,
+    trace TEXT NOT NULL DEFAULT '[]',
+    parent TEXT,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS jobs_input_key ON jobs (input_key, created_at);
+"""
+
+# Colonnes ajoutées après la création initiale de la base : (nom, définition)
+COLUMNS = [
+    ("trace", "trace TEXT NOT NULL DEFAULT '[]'"),
+    ("parent", "parent TEXT"),
+    ("doc_hash", "doc_hash TEXT"),
+]
+
+
+def input_key(pdf_bytes, user_text):
+    doc_hash = pipeline.document_hash(pdf_bytes) if pdf_bytes else ""
+    return hashlib.sha256(json.dumps([doc_hash, user_text], ensure_ascii=False).encode("utf-8")).hexdigest()
+
+
+class JobStore:
+    # Tâches persistées dans SQLite, exports dans un répertoire par tâche ; chaque PDF source
+    # n'est enregistré qu'une fois (par empreinte), quel que soit le nombre de tâches qui l'utilisent
+
+    def __init__(self, path=config.JOBS_DB_PATH, directory=config.JOBS_DIR):
+        self.path = path
+        self.directory = directory
+        self.inputs_dir = os.path.join(directory, "inputs")
+        os.makedirs(self.inputs_dir, exist_ok=True)
+        with self._connect() as conn:
+            conn.executescript(SCHEMA)
+            existing = {row["name"] for row in conn.execute("PRAGMA table_info(jobs)")}
+            for name, definition in COLUMNS:
+                if name not in existing:
+                    conn.execute(f"ALTER TABLE jobs ADD COLUMN {definition}")
+
+    def _connect(self):
+        return connect(self.path, row_factory=sqlite3.Row)
+
+    def job_dir(self, job_id):
+        return os.path.join(self.directory, job_id)
+
+    def input_path(self, doc_hash):
+        return os.path.join(self.inputs_dir, f"{doc_hash}.pdf")
+
+    def create(self, key, source, user_text, regenerate, pdf_bytes=None, parent=None, status=QUEUED, error=None):
+        job_id = uuid.uuid4().hex
+        doc_hash = pipeline.document_hash(pdf_bytes) if pdf_bytes else None
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT INTO jobs (id, input_key, status, source, user_text, regenerate, parent, doc_hash, error, created_at, updated_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (job_id, key, status, source, user_text, json.dumps(list(regenerate)), parent, doc_hash, error, now, now),
+            )
+        if doc_hash:
+            path = self.input_path(doc_hash)
+            try:
+                # Déjà enregistré pour une autre tâche : la date de modification protège le fichier de purge()
+                os.utime(path)
+            except FileNotFoundError:
+                with open(f"{path}.{job_id}.tmp", "wb") as f:
+                    f.write(pdf_bytes)
+                os.replace(f"{path}.{job_id}.tmp", path)
+        return job_id
+
+    def input_pdf(self, job):
+        if job["doc_hash"]:
+            try:
+                with open(self.input_path(job["doc_hash"]), "rb") as f:
+                    return f.read()
+            except FileNotFoundError:
+                return None
+        # Tâches créées avant le stockage par empreinte
+        return self.read_file(job["id"], "input.pdf")
+
+    def purge(self, retention=None):
+        # Supprime les tâches terminées depuis plus de retention secondes (texte saisi, sections,
+        # Markdown), puis les PDF sources qui ne servent plus à aucune tâche
+        cutoff = time.time() - (config.JOB_RETENTION if retention is None else retention)
+        with self._connect() as conn:
+            rows = conn.execute(
+                f"SELECT id FROM jobs WHERE status IN ({', '.join('?' * len(FINISHED))}) AND updated_at < ?",
+                (*FINISHED, cutoff),
+            ).fetchall()
+            conn.executemany("DELETE FROM jobs WHERE id = ?", [(row["id"],) for row in rows])
+            used = {row["doc_hash"] for row in conn.execute("SELECT DISTINCT doc_hash FROM jobs WHERE doc_hash IS NOT NULL")}
+        for row in rows:
+            shutil.rmtree(self.job_dir(row["id"]), ignore_errors=True)
+        for name in os.listdir(self.inputs_dir):
+            path = os.path.join(self.inputs_dir, name)
+            doc_hash = name.split(".", 1)[0]
+            try:
+                if doc_hash not in used and os.path.getmtime(path) < cutoff:
+                    os.remove(path)
+            except FileNotFoundError:
+                pass
+        if rows:
+            metrics.count("jobs_purged", len(rows))
+        return len(rows)
+
+    def _row_to_job(self, row):
+        if row is None:
+            return None
+        job = dict(row)
+        job["regenerate"] = json.loads(job["regenerate"])
+        job["sections"] = json.loads(job["sections"])
+        job["trace"] = json.loads(job["trace"])
+        return job
+
+    def get(self, job_id):
+        with self._connect() as conn:
+            row = conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return self._row_to_job(row)
+
+    def latest(self, key):
+        # Dernière tâche ni échouée ni incomplète pour les mêmes entrées
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT * FROM jobs WHERE input_key = ? AND status NOT IN (?, ?) ORDER BY created_at DESC LIMIT 1",
+                (key, FAILED, PARTIAL),
+            ).fetchone()
+        return self._row_to_job(row)
+
+    def claim(self, job_id, stale_after):
+        # Passage atomique en cours d'exécution : une tâche n'est traitée que par un seul worker
+        now = time.time()
+        with self._connect() as conn:
+            cursor = conn.execute(
+                "UPDATE jobs SET status = ?, updated_at = ? "
+                "WHERE id = ? AND (status = ? OR (status = ? AND updated_at < ?))",
+                (RUNNING, now, job_id, QUEUED, RUNNING, now - stale_after),
+            )
+        return cursor.rowcount == 1
+
+    def update(self, job_id, **fields):
+        fields["updated_at"] = time.time()
+        assignments = ", ".join(f"{name} = ?" for name in fields)
+        with self._connect() as conn:
+            conn.execute(f"UPDATE jobs SET {assignments} WHERE id = ?", (*fields.values(), job_id))
+
+    def save_section(self, job_id, name, entry):
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            row = conn.execute("SELECT sections FROM jobs WHERE id = ?", (job_id,)).fetchone()
+            sections = json.loads(row["sections"])
+            sections[name] = entry
+            conn.execute(
+                "UPDATE jobs SET sections = ?, updated_at = ? WHERE id = ?",
+                (json.dumps(sections, ensure_ascii=False), time.time(), job_id),
+            )
+
+    def resumable(self, stale_after):
+        # Tâches en attente ou interrompues (plus de nouvelles depuis stale_after secondes)
+        with self._connect() as conn:
+            rows = conn.execute(
+                "SELECT id FROM jobs WHERE status = ? OR (status = ? AND updated_at < ?) ORDER BY created_at",
+                (QUEUED, RUNNING, time.time() - stale_after),
+            ).fetchall()
+        return [row["id"] for row in rows]
+
+    def read_file(self, job_id, file_name):
+        try:
+            with open(os.path.join(self.job_dir(job_id), file_name), "rb") as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    def write_file(self, job_id, file_name, data):
+        os.makedirs(self.job_dir(job_id), exist_ok=True)
+        path = os.path.join(self.job_dir(job_id), file_name)
+        with open(f"{path}.tmp", "wb") as f:
+            f.write(data)
+        os.replace(f"{path}.tmp", path)
+
+
+class JobRunner:
+    # Pool local de workers : l'interface soumet une tâche, suit sa progression et récupère les exports
+
+    def __init__(self, store=None, max_workers=None):
+        self.store = store or JobStore()
+        # Sections gardées en mémoire dans la limite du gestionnaire de ressources (toutes restent sur disque)
+        self.cache = SectionCache(memory=ResourcePool(get_manager(), "section", entry_size))
+        self.semantic_cache = SemanticCache() if config.SEMANTIC_CACHE else None
+        self.executor = ThreadPoolExecutor(max_workers=max_workers or config.JOB_WORKERS, thread_name_prefix="ishai-job")
+        self._streams = {}
+        self._lock = threading.Lock()
+        self._purged_at = 0.0
+        self.resume()
+
+    def submit(self, pdf_bytes, source, user_text, regenerate=(), previous_job_id=None, retry_failed=False):
+        # previous_job_id : version précédente dans la même session, dont les sections
+        # non affectées par la modification sont réutilisées
+        # retry_failed : relance demandée des sections en erreur d'un plan incomplet
+        key = input_key(pdf_bytes, user_text)
+        if not regenerate:
+            previous = self.store.get(previous_job_id) if previous_job_id and not retry_failed else None
+            if previous is not None and previous["input_key"] == key and previous["status"] in (PARTIAL, FAILED):
+                # Plan incomplet ou en échec de la session : affiché tel quel à chaque interaction, sans rappeler
+                # l'API (une erreur déterministe échouerait à chaque fois)
+                return previous_job_id
+            job = self.store.latest(key)
+            if job is not None:
+                if job["status"] != DONE and job["updated_at"] < time.time() - config.JOB_STALE_AFTER:
+                    # Tâche interrompue (worker arrêté) : reprise ici
+                    self.executor.submit(self._run, job["id"])
+                return job["id"]
+        if pdf_bytes:
+            try:
+                # Limites de taille et de pages vérifiées à la soumission : un seul message d'erreur,
+                # aucune section lancée
+                open_pdf(pdf_bytes)
+            except ValueError as e:
+                return self.store.create(key, source, user_text, regenerate, parent=previous_job_id, status=FAILED, error=str(e))
+        job_id = self.store.create(key, source, user_text, regenerate, pdf_bytes, parent=previous_job_id)
+        self.executor.submit(self._run, job_id)
+        return job_id
+
+    def resume(self):
+        self.purge()
+        for job_id in self.store.resumable(config.JOB_STALE_AFTER):
+            self.executor.submit(self._run, job_id)
+
+    def purge(self):
+        # Au plus une fois par heure : au démarrage, puis à la fin des tâches
+        with self._lock:
+            if time.time() - self._purged_at < 3600:
+                return
+            self._purged_at = time.time()
+        self.store.purge()
+        # Sections (dont la clé dépend du texte saisi) et documents rendus, d'après leur date d'écriture
+        self.cache.purge(config.JOB_RETENTION)
+        exports.purge(config.JOB_RETENTION)
+
+    def status(self, job_id):
+        return self.store.get(job_id)
+
+    def streamed(self, job_id):
+        # Texte partiel des sections en cours de génération
+        with self._lock:
+            return dict(self._streams.get(job_id, {}))
+
+    def artifact(self, job_id, kind):
+        return self.store.read_file(job_id, ARTIFACTS[kind])
+
+    def business_plan(self, job_id):
+        # (markdown, métadonnées) d'une tâche terminée, à transmettre aux exports
+        markdown_content = self.artifact(job_id, "markdown")
+        if markdown_content is None:
+            return None, None
+        return markdown_content.decode("utf-8"), json.loads(self.artifact(job_id, "meta"))
+
+    def _on_token(self, job_id, section_name, delta):
+        with self._lock:
+            sections = self._streams.setdefault(job_id, {})
+            sections[section_name] = sections.get(section_name, "") + delta
+
+    def _run(self, job_id):
+        if not self.store.claim(job_id, config.JOB_STALE_AFTER):
+            return
+        job = self.store.get(job_id)
+        parent = self.store.get(job["parent"]) if job["parent"] else None
+        # Trace des étapes de cette exécution, enregistrée avec le statut final de la tâche
+        trace = metrics.Trace(job_id)
+        fields = {"status": FAILED}
+        try:
+            with metrics.activate(trace), metrics.span("plan"):
+                # Les sections déjà terminées avant une interruption sont relues depuis le cache
+                generated = pipeline.generate_sections(
+                    self.store.input_pdf(job),
+                    job["source"],
+                    job["user_text"],
+                    self.cache,
+                    regenerate=job["regenerate"],
+                    on_done=lambda name, entry: self.store.save_section(job_id, name, entry),
+                    on_token=lambda name, delta: self._on_token(job_id, name, delta),
+                    on_stage=lambda stage: self.store.update(job_id, stage=stage),
+                    semantic_cache=self.semantic_cache,
+                    previous=parent["sections"] if parent else None,
+                )
+                results = {name: entry["content"] for name, entry in generated.items()}
+                markdown_content, meta = pipeline.build_business_plan(results)
+            self.store.write_file(job_id, ARTIFACTS["meta"], json.dumps(meta, ensure_ascii=False).encode("utf-8"))
+            self.store.write_file(job_id, ARTIFACTS["markdown"], markdown_content.encode("utf-8"))
+            failed = [name for name, entry in generated.items() if entry.get("error")]
+            fields = {"status": PARTIAL if failed else DONE, "stage": None}
+        except Exception as e:
+            fields["error"] = str(e)
+        finally:
+            self.store.update(job_id, trace=json.dumps(trace.to_list(), ensure_ascii=False), **fields)
+            metrics.count("plans", status=fields["status"])
+            metrics.log_trace(trace, status=fields["status"])
+            with self._lock:
+                self._streams.pop(job_id, None)
+        self.purge()
@@ -0,0 +1,60 @@
+import re
+
+# Découpage d'un document Markdown en blocs (titres, listes, tableaux, paragraphes),
+# sans dépendance lourde : partagé par l'export Word et l'extraction des tableaux chiffrés
+
+HEADING = re.compile(r"^(#{1,6})\s+(.*?)\s*#*$")
+BULLET = re.compile(r"^([ \t]*)[-*+]\s+(.*)$")
+NUMBERED = re.compile(r"^([ \t]*)\d+[.)]\s+(.*)$")
+HORIZONTAL_RULE = re.compile(r"^([-*_])(\s*\1){2,}$")
+TABLE_SEPARATOR = re.compile(r"^\|?\s*:?-+:?\s*(\|\s*:?-+:?\s*)*\|?$")
+TOC_MARKER = "[TOC]"
+MAX_LIST_LEVEL = 2
+
+
+def _list_level(indent):
+    return min(len(indent.expandtabs(4)) // 2, MAX_LIST_LEVEL)
+
+
+def _split_row(line):
+    line = line.strip()
+    if line.startswith("|"):
+        line = line[1:]
+    if line.endswith("|"):
+        line = line[:-1]
+    return [cell.strip() for cell in line.split("|")]
+
+
+def tokenize(markdown_content):
+    # Renvoie la liste des blocs (type, données) du document
+    blocks = []
+    table = None
+    for raw_line in markdown_content.split("\n"):
+        line = raw_line.strip()
+        if line.startswith("|"):
+            if table is None:
+                table = []
+                blocks.append(("table", table))
+            if not TABLE_SEPARATOR.match(line):
+                table.append(_split_row(line))
+            continue
+        table = None
+        if not line or HORIZONTAL_RULE.match(line):
+            continue
+        if line == TOC_MARKER:
+            blocks.append(("toc", None))
+            continue
+        match = HEADING.match(line)
+        if match:
+            blocks.append(("heading", (len(match.group(1)), match.group(2))))
+            continue
+        match = BULLET.match(raw_line)
+        if match:
+            blocks.append(("bullet", (_list_level(match.group(1)), match.group(2))))
+            continue
+        match = NUMBERED.match(raw_line)
+        if match:
+            blocks.append(("number", (_list_level(match.group(1)), match.group(2))))
+            continue
+        blocks.append(("paragraph", line))
+    return blocks
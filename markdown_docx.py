@@ -0,0 +1,119 @@
+import re
+from io import BytesIO
+
+from docx import Document
+from docx.oxml import OxmlElement
+from docx.oxml.ns import qn
+from docx.table import _Cell
+
+from markdown_blocks import tokenize
+
+# Conversion Markdown → Word en un seul passage : découpage en blocs (markdown_blocks), puis écriture séquentielle
+
+INLINE = re.compile(
+    r"\*\*\*(.+?)\*\*\*"                   # gras italique
+    r"|\*\*(.+?)\*\*|__(.+?)__"            # gras
+    r"|\*(?=\S)(.+?)(?<=\S)\*"             # italique
+    r"|(?<!\w)_(?=\S)(.+?)(?<=\S)_(?!\w)"  # italique
+    r"|`([^`]+)`"                          # code
+)
+TOC_LEVELS = "1-2"
+
+
+def add_inline(paragraph, text, bold=False):
+    # Gras, italique et code en ligne
+    position = 0
+    for match in INLINE.finditer(text):
+        if match.start() > position:
+            paragraph.add_run(text[position:match.start()]).bold = bold or None
+        bold_italic, strong, strong_alt, emphasis, emphasis_alt, code = match.groups()
+        if bold_italic:
+            run = paragraph.add_run(bold_italic)
+            run.bold = run.italic = True
+        elif strong or strong_alt:
+            paragraph.add_run(strong or strong_alt).bold = True
+        elif emphasis or emphasis_alt:
+            run = paragraph.add_run(emphasis or emphasis_alt)
+            run.italic = True
+            run.bold = bold or None
+        else:
+            run = paragraph.add_run(code)
+            run.font.name = "Courier New"
+            run.bold = bold or None
+        position = match.end()
+    if position < len(text):
+        paragraph.add_run(text[position:]).bold = bold or None
+
+
+def add_toc(doc):
+    # Champ TOC de Word, recalculé à l'ouverture du document
+    paragraph = doc.add_paragraph()
+    run = paragraph.add_run()
+    begin = OxmlElement("w:fldChar")
+    begin.set(qn("w:fldCharType"), "begin")
+    instruction = OxmlElement("w:instrText")
+    instruction.set(qn("xml:space"), "preserve")
+    instruction.text = f'TOC \\o "{TOC_LEVELS}" \\h \\z \\u'
+    separate = OxmlElement("w:fldChar")
+    separate.set(qn("w:fldCharType"), "separate")
+    placeholder = OxmlElement("w:t")
+    placeholder.text = "Table des matières : mettre à jour les champs (F9) pour l'afficher."
+    end = OxmlElement("w:fldChar")
+    end.set(qn("w:fldCharType"), "end")
+    for element in (begin, instruction, separate, placeholder, end):
+        run._r.append(element)
+
+    settings = doc.settings.element
+    if settings.find(qn("w:updateFields")) is None:
+        update_fields = OxmlElement("w:updateFields")
+        update_fields.set(qn("w:val"), "true")
+        settings.append(update_fields)
+
+
+def add_table(doc, rows):
+    # Ligne par ligne, sans passer par table.cell(i, j) qui reconstruit toute la grille à chaque appel
+    num_cols = max(len(row) for row in rows)
+    table = doc.add_table(rows=0, cols=num_cols)
+    table.style = "Table Grid"
+    for i, row in enumerate(rows):
+        tr = table.add_row()._tr
+        for tc, text in zip(tr.tc_lst, row + [""] * (num_cols - len(row))):
+            add_inline(_Cell(tc, table).paragraphs[0], text, bold=(i == 0))
+    return table
+
+
+def markdown_to_docx(markdown_content, default_title="Business Plan"):
+    doc = Document()
+    blocks = tokenize(markdown_content)
+
+    # Le premier titre de niveau 1 devient le titre du document, suivi de la table des matières
+    if blocks and blocks[0][0] == "heading" and blocks[0][1][0] == 1:
+        add_inline(doc.add_heading("", 0), blocks.pop(0)[1][1])
+    else:
+        doc.add_heading(default_title, 0)
+    if not any(kind == "toc" for kind, _ in blocks):
+        add_toc(doc)
+
+    for kind, data in blocks:
+        if kind == "heading":
+            level, text = data
+            add_inline(doc.add_heading("", level), text)
+        elif kind == "bullet":
+            level, text = data
+            add_inline(doc.add_paragraph(style="List Bullet" + (f" {level + 1}" if level else "")), text)
+        elif kind == "number":
+            level, text = data
+            add_inline(doc.add_paragraph(style="List Number" + (f" {level + 1}" if level else "")), text)
+        elif kind == "table":
+            if data:
+                add_table(doc, data)
+        elif kind == "toc":
+            add_toc(doc)
+        else:
+            add_inline(doc.add_paragraph(), data)
+
+    # Sauvegarder le document dans un buffer mémoire
+    buffer = BytesIO()
+    doc.save(buffer)
+    buffer.seek(0)
+    return buffer
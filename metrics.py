@@ -0,0 +1,225 @@
+import json
+import logging
+import os
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from contextvars import ContextVar
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import config
+
+# Instrumentation des étapes : chaque génération a sa trace (affichée dans l'interface et
+# conservée avec la tâche), et toutes les mesures alimentent des agrégats exposés au format
+# texte de Prometheus et journalisés.
+
+logger = logging.getLogger("ishai.metrics")
+
+# Bornes des histogrammes de durée (secondes)
+BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+_trace = ContextVar("ishai_trace", default=None)
+_open_spans = ContextVar("ishai_open_spans", default=())
+
+
+class Trace:
+    # Étapes d'une génération, dans l'ordre où elles se terminent
+
+    def __init__(self, name):
+        self.name = name
+        self.started = time.time()
+        self.spans = []
+        self._lock = threading.Lock()
+
+    def add(self, span):
+        with self._lock:
+            self.spans.append(span)
+
+    def to_list(self):
+        with self._lock:
+            return list(self.spans)
+
+
+class Registry:
+    # Agrégats du processus : histogrammes de durée par étape et compteurs étiquetés
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._histograms = {}
+        self._counters = {}
+        self._gauges = {}
+
+    def observe(self, stage, seconds):
+        with self._lock:
+            histogram = self._histograms.setdefault(stage, {"buckets": [0] * len(BUCKETS), "count": 0, "sum": 0.0})
+            index = bisect_left(BUCKETS, seconds)
+            if index < len(BUCKETS):
+                histogram["buckets"][index] += 1
+            histogram["count"] += 1
+            histogram["sum"] += seconds
+
+    def count(self, name, value=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def set_gauge(self, name, value, **labels):
+        with self._lock:
+            self._gauges[(name, tuple(sorted(labels.items())))] = value
+
+    def render_prometheus(self):
+        lines = [
+            "# HELP ishai_stage_seconds Durée des étapes de génération et d'export.",
+            "# TYPE ishai_stage_seconds histogram",
+        ]
+        with self._lock:
+            for stage, histogram in sorted(self._histograms.items()):
+                cumulative = 0
+                for bound, count in zip(BUCKETS, histogram["buckets"]):
+                    cumulative += count
+                    lines.append(f'ishai_stage_seconds_bucket{{stage="{stage}",le="{bound}"}} {cumulative}')
+                lines.append(f'ishai_stage_seconds_bucket{{stage="{stage}",le="+Inf"}} {histogram["count"]}')
+                lines.append(f'ishai_stage_seconds_sum{{stage="{stage}"}} {histogram["sum"]:.6f}')
+                lines.append(f'ishai_stage_seconds_count{{stage="{stage}"}} {histogram["count"]}')
+            names = sorted({name for name, _ in self._counters})
+            for name in names:
+                lines.append(f"# TYPE ishai_{name}_total counter")
+                for (counter, labels), value in sorted(self._counters.items()):
+                    if counter != name:
+                        continue
+                    label_text = ",".join(f'{key}="{_escape(label)}"' for key, label in labels)
+                    lines.append(f"ishai_{name}_total{{{label_text}}} {value}" if label_text else f"ishai_{name}_total {value}")
+            for name in sorted({name for name, _ in self._gauges}):
+                lines.append(f"# TYPE ishai_{name} gauge")
+                for (gauge, labels), value in sorted(self._gauges.items()):
+                    if gauge != name:
+                        continue
+                    label_text = ",".join(f'{key}="{_escape(label)}"' for key, label in labels)
+                    lines.append(f"ishai_{name}{{{label_text}}} {value}" if label_text else f"ishai_{name} {value}")
+        return "\n".join(lines) + "\n"
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+REGISTRY = Registry()
+
+
+@contextmanager
+def activate(trace):
+    # Les étapes exécutées dans ce contexte (et dans les tâches lancées par run_dependency_graph)
+    # sont rattachées à la trace
+    token = _trace.set(trace)
+    try:
+        yield trace
+    finally:
+        _trace.reset(token)
+
+
+def record(stage, seconds, trace=None, **attributes):
+    REGISTRY.observe(stage, seconds)
+    trace = trace or _trace.get()
+    if trace is not None:
+        parents = _open_spans.get()
+        trace.add({
+            "stage": stage,
+            "seconds": round(seconds, 4),
+            "offset": round(time.time() - seconds - trace.started, 4),
+            "parent": parents[-1]["stage"] if parents else None,
+            "thread": threading.current_thread().name,
+            **attributes,
+        })
+
+
+@contextmanager
+def span(stage, **attributes):
+    # Mesure une étape ; annotate() complète les attributs de l'étape en cours
+    current = {"stage": stage, "attributes": dict(attributes)}
+    token = _open_spans.set(_open_spans.get() + (current,))
+    started = time.perf_counter()
+    try:
+        yield current["attributes"]
+    except Exception as e:
+        current["attributes"]["error"] = type(e).__name__
+        raise
+    finally:
+        _open_spans.reset(token)
+        record(stage, time.perf_counter() - started, **current["attributes"])
+
+
+def annotate(**attributes):
+    parents = _open_spans.get()
+    if parents:
+        parents[-1]["attributes"].update(attributes)
+
+
+def count(name, value=1, **labels):
+    REGISTRY.count(name, value, **labels)
+
+
+def gauge(name, value, **labels):
+    # Valeur instantanée (mémoire suivie, sessions actives...)
+    REGISTRY.set_gauge(name, value, **labels)
+
+
+_log_lock = threading.Lock()
+
+
+def _log_handler():
+    # Fichier des traces ouvert à la première génération : sans gestionnaire, le niveau INFO
+    # serait ignoré par la configuration par défaut de logging
+    with _log_lock:
+        if not any(getattr(handler, "ishai_traces", False) for handler in logger.handlers):
+            from logging.handlers import RotatingFileHandler
+
+            os.makedirs(os.path.dirname(os.path.abspath(config.METRICS_LOG_PATH)), exist_ok=True)
+            handler = RotatingFileHandler(config.METRICS_LOG_PATH, maxBytes=50 * 1024 * 1024, backupCount=3, encoding="utf-8")
+            handler.setFormatter(logging.Formatter("%(message)s"))
+            handler.ishai_traces = True
+            logger.addHandler(handler)
+            logger.setLevel(logging.INFO)
+
+
+def log_trace(trace, **fields):
+    # Puits de journalisation : une ligne JSON par génération (config.METRICS_LOG_PATH)
+    if config.METRICS_LOG:
+        _log_handler()
+        logger.info(json.dumps({"trace": trace.name, **fields, "spans": trace.to_list()}, ensure_ascii=False))
+
+
+def summarize(spans):
+    # Durée cumulée et nombre d'occurrences par étape
+    totals = {}
+    for item in spans:
+        total = totals.setdefault(item["stage"], {"stage": item["stage"], "count": 0, "seconds": 0.0})
+        total["count"] += 1
+        total["seconds"] = round(total["seconds"] + item["seconds"], 4)
+    return sorted(totals.values(), key=lambda total: total["seconds"], reverse=True)
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = REGISTRY.render_prometheus().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_http_server(port=None):
+    # Point d'accès /metrics pour Prometheus, dans un thread du processus (désactivé si port = 0)
+    port = config.METRICS_PORT if port is None else port
+    if not port:
+        return None
+    server = ThreadingHTTPServer(("0.0.0.0", port), _MetricsHandler)
+    threading.Thread(target=server.serve_forever, name="ishai-metrics", daemon=True).start()
+    return server
@@ -0,0 +1,416 @@
+import openai
+import hashlib
+import os
+import re
+import shutil
+import threading
+import time
+import config
+import metrics
+from clients import get_api_key, get_chat_llm, get_embeddings
+from ingestion import iter_chunk_batches
+from resources import get_manager, index_size
+from retrieval import query_vectors, retriever_for
+from rate_limiter import Coalescer, get_limiter
+from routing import STATS as route_stats, route_for
+from scheduler import RETRYABLE_ERRORS, call_with_backoff, run_dependency_graph
+from section_cache import make_key
+from semantic_cache import namespace
+from incremental import material_change, section_inputs
+from context_builder import build_context, count_tokens, section_budget
+from templates import dependencies, load_templates
+
+# langchain, FAISS et python-docx ne sont importés que dans les fonctions qui s'en servent :
+# le démarrage de l'application n'en dépend pas et un texte seul n'indexe jamais de PDF
+
+def document_hash(pdf_bytes):
+    # Empreinte du contenu du PDF et des paramètres de découpage
+    digest = hashlib.sha256(pdf_bytes)
+    digest.update(f"{config.CHUNK_SIZE}:{config.CHUNK_OVERLAP}".encode())
+    return digest.hexdigest()
+
+def create_faiss_db(documents):
+    from langchain.vectorstores import FAISS
+
+    if not documents:
+        raise ValueError("Aucun document trouvé pour créer la base de données FAISS.")
+    return FAISS.from_documents(documents, get_embeddings())
+
+def load_or_create_faiss_db(pdf_bytes, doc_hash, source="document.pdf", stats=None):
+    # Un seul index par document : réutilisé par toutes les sections et sauvegardé sur disque
+    from langchain.schema import Document as LangchainDocument
+    from langchain.vectorstores import FAISS
+
+    # Index déjà chargé par une autre session ou une génération précédente
+    resources = get_manager()
+    db = resources.get(("index", doc_hash))
+    if db is not None:
+        metrics.count("index_memory", result="hit")
+        return db
+    index_dir = os.path.join(config.FAISS_CACHE_DIR, doc_hash)
+    if os.path.isdir(index_dir):
+        # L'index a été écrit par cette application, la désérialisation est donc sûre
+        with metrics.span("index_load"):
+            db = FAISS.load_local(index_dir, get_embeddings(), allow_dangerous_deserialization=True)
+        return resources.put(("index", doc_hash), db, index_size(db), kind="index")
+    # Les lots de pages sont indexés au fur et à mesure de leur extraction
+    db = None
+    for batch in iter_chunk_batches(pdf_bytes, source, stats):
+        documents = [LangchainDocument(page_content=text, metadata=metadata) for text, metadata in batch]
+        if not documents:
+            continue
+        # Les embeddings du lot apparaissent comme étape fille ("embed") de l'indexation
+        with metrics.span("index_build", chunks=len(documents)):
+            if db is None:
+                db = create_faiss_db(documents)
+            else:
+                db.add_documents(documents)
+    if db is None:
+        return None
+    tmp_dir = f"{index_dir}.{os.getpid()}.tmp"
+    with metrics.span("index_save"):
+        db.save_local(tmp_dir)
+    try:
+        os.replace(tmp_dir, index_dir)
+    except OSError:
+        # Un autre processus a sauvegardé le même document entre-temps
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+    return resources.put(("index", doc_hash), db, index_size(db), kind="index")
+
+def query_vector(query):
+    # Les requêtes fixes de toutes les sections sont embeddées ensemble à la première recherche
+    queries = [template.query for template in TEMPLATES.values()]
+    return query_vectors(queries + [query], get_embeddings())[query]
+
+def retrieve_chunks(db, query, k=None):
+    # Extraits les plus pertinents pour la requête, du plus pertinent au moins pertinent
+    if config.RETRIEVAL_MODE == "hybrid":
+        return retriever_for(db).search(query, query_vector(query), k=k)
+    documents = db.similarity_search(query, k=k or config.RETRIEVAL_TOP_K)
+    return [document.page_content for document in documents]
+
+_coalescer = Coalescer()
+
+def request_key(messages, route):
+    payload = repr((route, [(m["role"], m["content"]) for m in messages]))
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+# Erreurs rejouées sur le modèle principal lorsqu'un modèle de repli prend le relais en cas de dépassement du délai
+RETRYABLE_BEFORE_FALLBACK = tuple(error for error in RETRYABLE_ERRORS if error is not openai.error.Timeout)
+
+def _request(model, route, messages, limiter, estimated, prompt_tokens, on_token, attributes, timeout, retryable):
+    started = time.perf_counter()
+    options = {"max_tokens": route.max_tokens} if route.max_tokens else {}
+    if on_token is None:
+        completion = call_with_backoff(
+            openai.ChatCompletion.create,
+            limiter=limiter,
+            tokens=estimated,
+            retryable=retryable,
+            api_key=get_api_key(),
+            model=model,
+            messages=messages,
+            temperature=route.temperature,
+            request_timeout=timeout,
+            **options
+        )
+        content = completion['choices'][0]['message']['content']
+        finish_reason = completion['choices'][0].get('finish_reason')
+        usage = completion['usage']
+    else:
+        stream = call_with_backoff(
+            openai.ChatCompletion.create,
+            limiter=limiter,
+            tokens=estimated,
+            retryable=retryable,
+            api_key=get_api_key(),
+            model=model,
+            messages=messages,
+            temperature=route.temperature,
+            request_timeout=timeout,
+            stream=True,
+            **options
+        )
+        parts = []
+        finish_reason = None
+        for chunk in stream:
+            finish_reason = chunk['choices'][0].get('finish_reason') or finish_reason
+            delta = chunk['choices'][0]['delta'].get('content')
+            if delta:
+                if not parts and attributes is not None:
+                    attributes["first_token_seconds"] = round(time.perf_counter() - started, 4)
+                parts.append(delta)
+                on_token(delta)
+        content = "".join(parts)
+        # L'API ne renvoie pas l'usage en mode flux : comptage local
+        usage = {"prompt_tokens": prompt_tokens, "completion_tokens": count_tokens(content)}
+    return content, usage, finish_reason, time.perf_counter() - started
+
+def complete(section, route, messages, prompt_tokens, on_token=None, attributes=None):
+    # Appel au LLM selon la route de la section, dans le limiteur de débit partagé : réservation
+    # du prompt et de la réponse maximale, corrigée ensuite avec l'usage réel.
+    # Si le modèle principal dépasse son délai avant la première réponse, le modèle de repli prend le relais.
+    # Renvoie (contenu, usage, modèle utilisé, réponse coupée par max_tokens).
+    limiter = get_limiter("chat")
+    estimated = prompt_tokens + (route.max_tokens or config.COMPLETION_TOKEN_RESERVE)
+    emitted = []
+
+    def relay(delta):
+        emitted.append(delta)
+        on_token(delta)
+    relay_token = relay if on_token is not None else None
+    model = route.model
+    try:
+        retryable = RETRYABLE_BEFORE_FALLBACK if route.fallback else RETRYABLE_ERRORS
+        content, usage, finish_reason, seconds = _request(model, route, messages, limiter, estimated, prompt_tokens, relay_token, attributes, route.timeout, retryable)
+    except openai.error.Timeout:
+        if not route.fallback or emitted:
+            raise
+        route_stats.timeout(section, model)
+        model = route.fallback
+        if attributes is not None:
+            attributes.update(model=model, fallback_from=route.model)
+        content, usage, finish_reason, seconds = _request(model, route, messages, limiter, estimated, prompt_tokens, relay_token, attributes, config.OPENAI_TIMEOUT, RETRYABLE_ERRORS)
+    limiter.settle(estimated, usage['prompt_tokens'] + usage['completion_tokens'])
+    price = route_stats.record(section, model, seconds, usage['prompt_tokens'], usage['completion_tokens'])
+    if attributes is not None and price is not None:
+        attributes["cost_usd"] = round(price, 6)
+    # Réponse interrompue par la limite de la route : à signaler, la section est incomplète
+    length_limited = finish_reason == "length"
+    if length_limited:
+        route_stats.length_limited(section, model)
+        if attributes is not None:
+            attributes["finish_reason"] = finish_reason
+    return content, usage, model, length_limited
+
+def generate_section(template, db, user_text, upstream, stats=None, on_token=None, semantic_cache=None):
+    # upstream : contenu des sections dont celle-ci dépend
+    # on_token : si fourni, la réponse est diffusée en flux et chaque fragment lui est transmis
+    # semantic_cache : si fourni, une réponse à un prompt quasi identique est réutilisée
+    route = route_for(template)
+    retrieved = []
+    if db is not None:
+        with metrics.span("retrieval", section=template.name, mode=config.RETRIEVAL_MODE) as attributes:
+            if config.RETRIEVAL_MODE == "chain":
+                # Ancien mode : la chaîne fait ses propres appels au LLM avant la complétion finale
+                # (la mémoire de conversation reste propre à chaque section)
+                from langchain.chains import ConversationalRetrievalChain
+                from langchain.memory import ConversationBufferMemory
+
+                memory = ConversationBufferMemory(memory_key='chat_history', return_messages=True)
+                qa_chain = ConversationalRetrievalChain.from_llm(get_chat_llm(route.model, route.temperature), retriever=db.as_retriever(), memory=memory)
+                retrieved.append(qa_chain.run({'question': template.query}))
+            else:
+                # Un seul appel au LLM : les extraits sont injectés directement dans le prompt
+                retrieved = retrieve_chunks(db, template.query)
+            attributes["chunks"] = len(retrieved)
+    # Contexte limité au budget de jetons de la section
+    with metrics.span("prompt_build", section=template.name) as attributes:
+        full_content, token_report = build_context(user_text, upstream, retrieved, template.query, section_budget(template.system_tokens, route.max_tokens))
+        attributes.update(context_tokens=token_report["total"], truncated=bool(token_report["truncated"]))
+    space = None
+    if semantic_cache is not None and template.semantic_cache:
+        space = namespace(template, route.model, route.temperature, route.max_tokens)
+        with metrics.span("semantic_lookup", section=template.name) as attributes:
+            cached, similarity, vector = semantic_cache.lookup(space, template.name, full_content)
+            attributes["hit"] = cached is not None
+        if cached is not None:
+            if on_token is not None:
+                on_token(cached["content"])
+            if stats is not None:
+                stats.update(token_report)
+                stats.update(prompt_tokens=0, completion_tokens=0, semantic_similarity=round(similarity, 4))
+            return cached["content"]
+    messages = [
+        {"role": "system", "content": template.system_message},
+        {"role": "user", "content": full_content}
+    ]
+    with metrics.span("llm_call", section=template.name, model=route.model, max_tokens=route.max_tokens, temperature=route.temperature, stream=on_token is not None) as attributes:
+        # Un prompt identique déjà en cours d'envoi (autre session, autre plan du lot) n'est pas renvoyé
+        (content, usage, model, length_limited), shared = _coalescer.run(
+            request_key(messages, route),
+            lambda: complete(template.name, route, messages, template.system_tokens + count_tokens(full_content) + 2 * 4 + 3, on_token, attributes),
+        )
+        if shared:
+            attributes["coalesced"] = True
+            if on_token is not None:
+                on_token(content)
+            usage = {"prompt_tokens": 0, "completion_tokens": 0}
+        attributes.update(prompt_tokens=usage['prompt_tokens'], completion_tokens=usage['completion_tokens'])
+    metrics.count("tokens", usage['prompt_tokens'], kind="prompt", model=model)
+    metrics.count("tokens", usage['completion_tokens'], kind="completion", model=model)
+    # Une réponse coupée n'est pas proposée aux prompts voisins
+    if space is not None and not shared and not length_limited:
+        semantic_cache.store(space, vector, {"content": content})
+    if stats is not None:
+        stats.update(token_report)
+        stats["prompt_tokens"] = usage['prompt_tokens']
+        stats["completion_tokens"] = usage['completion_tokens']
+        stats["model"] = model
+        if "cost_usd" in attributes and not shared:
+            stats["cost_usd"] = attributes["cost_usd"]
+        if shared:
+            stats["coalesced"] = True
+        if length_limited:
+            stats["length_limited"] = True
+    return content
+
+def error_message(error):
+    # Message affiché à la place d'une section dont la génération a échoué
+    if isinstance(error, openai.error.RateLimitError):
+        return "limite de débit de l'API OpenAI atteinte malgré plusieurs tentatives, réessayez dans quelques minutes."
+    if isinstance(error, openai.error.AuthenticationError):
+        return "clé API OpenAI refusée."
+    if isinstance(error, (openai.error.Timeout, openai.error.APIConnectionError, openai.error.ServiceUnavailableError)):
+        return "l'API OpenAI ne répond pas, réessayez plus tard."
+    return str(error)
+
+def extract_company_name(text):
+    match = re.search(r"(nom de l'entreprise est|Nom de l'entreprise|La vision de) ([\w\s]+)", text, re.IGNORECASE)
+    if match:
+        return match.group(2).strip()
+    return "Nom de l'entreprise non trouvé"
+
+# Numéro suivi d'une puce "* " (et non d'un texte en gras "**Titre**", laissé intact)
+NUMBERED_BULLET = re.compile(r'^\d+\.\s+\*\s+')
+
+def generate_markdown(results, company_name):
+    # Construction par liste de lignes puis jointure unique (pas de concaténations répétées)
+    lines = ["# Business Plan", "", f"## Entreprise: {company_name}", ""]
+
+    for sec_name, content in results.items():
+        lines.append(f"## {sec_name}")
+        lines.append("")
+        for paragraph in content.split('\n'):
+            if paragraph.startswith('* '):  # Bullet points
+                lines.append(f"- {paragraph[2:]}")
+            elif NUMBERED_BULLET.match(paragraph):  # "1. * texte" : puce littérale après le numéro
+                lines.append(f"- {NUMBERED_BULLET.sub('', paragraph, count=1)}")
+            else:
+                lines.append(paragraph)
+        lines.append("")
+
+    return "\n".join(lines) + "\n"
+
+def markdown_to_word_via_text(markdown_content):
+    from markdown_docx import markdown_to_docx
+
+    # Créer le document Word (titres, listes imbriquées, tableaux, gras/italique, table des matières)
+    return markdown_to_docx(markdown_content)
+
+# Sections du business plan : modèles versionnés chargés une seule fois (voir templates.py)
+TEMPLATES = load_templates()
+
+def section_cache_keys(doc_hash, user_text):
+    return {
+        # Le modèle, la température et la longueur de réponse de la route font partie de la clé
+        name: make_key(doc_hash, user_text, template.system_message, template.query, route_for(template).model, route_for(template).temperature, route_for(template).max_tokens)
+        for name, template in TEMPLATES.items()
+    }
+
+def generate_sections(pdf_bytes, source, user_text, cache, regenerate=(), on_done=None, on_token=None, on_stage=None, semantic_cache=None, previous=None):
+    # Génère (ou relit depuis le cache) toutes les sections du business plan.
+    # on_done(nom, entrée) à chaque section terminée, on_token(nom, fragment) en mode flux,
+    # on_stage(libellé) à chaque changement d'étape. Une section à régénérer ne passe pas
+    # par le cache sémantique.
+    # previous : sections de la version précédente (même session), réutilisées lorsque
+    # leurs entrées n'ont pas changé de façon significative
+    doc_hash = document_hash(pdf_bytes) if pdf_bytes else ""
+    cache_keys = section_cache_keys(doc_hash, user_text)
+    # Clés sans le texte de l'utilisateur : consignes, modèle et document
+    context_keys = section_cache_keys(doc_hash, None)
+    for name in regenerate:
+        cache.invalidate(cache_keys[name])
+
+    # Le document n'est indexé qu'au premier besoin d'une section effectivement générée
+    index = {}
+    index_lock = threading.Lock()
+
+    def get_db():
+        with index_lock:
+            # Un document illisible ou hors limites n'est lu qu'une fois : les autres sections reçoivent la même erreur
+            if "error" in index:
+                raise index["error"]
+            if pdf_bytes and "db" not in index:
+                if on_stage:
+                    on_stage("Indexation du document...")
+                ingestion = {}
+                try:
+                    # Débit d'ingestion enregistré dans la trace de la tâche (absent si l'index était déjà construit)
+                    with metrics.span("ingestion") as attributes:
+                        index["db"] = load_or_create_faiss_db(pdf_bytes, doc_hash, source, stats=ingestion)
+                        if ingestion:
+                            attributes.update(pages=ingestion["pages"], pages_per_second=round(ingestion["pages_per_second"], 1))
+                except Exception as e:
+                    index["error"] = e
+                    raise
+                if on_stage:
+                    on_stage("Génération du business plan...")
+            return index.get("db")
+
+    def reuse(section_name, upstream):
+        entry = (previous or {}).get(section_name)
+        if not config.INCREMENTAL or entry is None or entry.get("error") or section_name in regenerate:
+            return None
+        with metrics.span("incremental_check", section=section_name) as attributes:
+            reason = material_change(entry.get("inputs"), context_keys[section_name], user_text, upstream, get_embeddings())
+            attributes["reused"] = reason is None
+            if reason is not None:
+                attributes["reason"] = reason
+        if reason is not None:
+            return None
+        # Les entrées d'origine sont conservées : des retouches successives ne s'accumulent pas
+        return dict(entry, reused=True)
+
+    def make_task(section_name):
+        def task(upstream):
+            with metrics.span("section", section=section_name) as attributes:
+                cached = cache.get(cache_keys[section_name])
+                attributes["cached"] = cached is not None
+                if cached is not None:
+                    return cached
+                # Une section dont une dépendance a échoué n'est ni générée ni mise en cache
+                failed = [name for name, entry in upstream.items() if entry.get("error")]
+                if failed:
+                    attributes["skipped"] = True
+                    return {"content": f"Erreur: section non générée, {', '.join(failed)} en erreur.", "error": True}
+                entry = reuse(section_name, upstream)
+                if entry is not None:
+                    cache.set(cache_keys[section_name], entry)
+                    return entry
+                # Contexte : texte de l'utilisateur et sections dont celle-ci dépend
+                upstream_content = {name: entry["content"] for name, entry in upstream.items()}
+                tokens = {}
+                stream = (lambda delta: on_token(section_name, delta)) if on_token and config.STREAM_SECTIONS else None
+                lookup = semantic_cache if section_name not in regenerate else None
+                try:
+                    content = generate_section(TEMPLATES[section_name], get_db(), user_text, upstream_content, stats=tokens, on_token=stream, semantic_cache=lookup)
+                except (ValueError, openai.error.OpenAIError) as e:
+                    # Section en erreur non mise en cache ; la tâche est marquée incomplète (jobs.PARTIAL)
+                    # et une nouvelle soumission la régénère
+                    return {"content": f"Erreur: {error_message(e)}", "error": True}
+                entry = {
+                    "content": content,
+                    "tokens": tokens,
+                    "inputs": section_inputs(context_keys[section_name], user_text, tokens.get("user_text", 0), upstream),
+                }
+                cache.set(cache_keys[section_name], entry)
+                return entry
+        return task
+
+    # Générer les sections indépendantes en parallèle, dans l'ordre des dépendances
+    if on_stage:
+        on_stage("Génération du business plan...")
+    generated = run_dependency_graph(
+        {name: make_task(name) for name in TEMPLATES.keys()},
+        dependencies(TEMPLATES),
+        on_done=on_done,
+    )
+    return {name: generated[name] for name in TEMPLATES.keys()}
+
+def build_business_plan(results):
+    # Markdown du business plan et métadonnées des exports (rendus à la demande par exports.py)
+    with metrics.span("markdown_build"):
+        company_name = extract_company_name(results.get("Résumé Exécutif", ""))
+        markdown_content = generate_markdown(results, company_name)
+    return markdown_content, {"title": "Business Plan", "author": company_name}
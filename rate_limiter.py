@@ -0,0 +1,193 @@
+import heapq
+import itertools
+import os
+import threading
+import time
+from concurrent.futures import Future
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import lru_cache
+
+import config
+import metrics
+from database import connect
+
+# Limitation de débit partagée : seaux de jetons (requêtes/min et jetons/min) communs à toutes
+# les sessions du processus, ou à tous les workers via une base SQLite locale (ISHAI_RATE_LIMIT_DB).
+# Les appels en attente sont servis par ordre de priorité (sessions interactives avant le lot),
+# puis d'arrivée ; un 429 suspend tous les appels plutôt que de multiplier les nouvelles tentatives.
+
+INTERACTIVE = 0
+BATCH = 1
+
+_priority = ContextVar("ishai_priority", default=INTERACTIVE)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS buckets (
+    name TEXT PRIMARY KEY,
+    requests REAL NOT NULL,
+    tokens REAL NOT NULL,
+    updated REAL NOT NULL,
+    blocked_until REAL NOT NULL DEFAULT 0
+);
+"""
+
+
+@contextmanager
+def priority(level):
+    # Priorité des appels lancés dans ce contexte (et dans les tâches de run_dependency_graph)
+    token = _priority.set(level)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+
+class RateLimiter:
+
+    def __init__(self, name, rpm, tpm, path=None):
+        self.name = name
+        self.rpm = rpm
+        self.tpm = tpm
+        self.path = path
+        self._condition = threading.Condition()
+        self._waiters = []
+        self._sequence = itertools.count()
+        self._state = {"requests": float(rpm), "tokens": float(tpm), "updated": time.time(), "blocked_until": 0.0}
+        if path:
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+            with connect(self.path, autocommit=True) as conn:
+                conn.executescript(SCHEMA)
+
+    @contextmanager
+    def _bucket(self):
+        # État du seau (dictionnaire modifiable), relu et réécrit atomiquement entre workers si partagé
+        if not self.path:
+            yield self._state
+            return
+        with connect(self.path, autocommit=True) as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            row = conn.execute("SELECT requests, tokens, updated, blocked_until FROM buckets WHERE name = ?", (self.name,)).fetchone()
+            state = dict(zip(("requests", "tokens", "updated", "blocked_until"), row)) if row else dict(self._state)
+            try:
+                yield state
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+            conn.execute(
+                "INSERT OR REPLACE INTO buckets (name, requests, tokens, updated, blocked_until) VALUES (?, ?, ?, ?, ?)",
+                (self.name, state["requests"], state["tokens"], state["updated"], state["blocked_until"]),
+            )
+            conn.execute("COMMIT")
+
+    def _refill(self, state, now):
+        elapsed = max(0.0, now - state["updated"])
+        if self.rpm:
+            state["requests"] = min(self.rpm, state["requests"] + elapsed * self.rpm / 60)
+        if self.tpm:
+            state["tokens"] = min(self.tpm, state["tokens"] + elapsed * self.tpm / 60)
+        state["updated"] = now
+
+    def _take(self, tokens):
+        # Prélève une requête et les jetons estimés ; sinon renvoie le délai d'attente (s)
+        now = time.time()
+        # Une requête plus grosse que le budget par minute passe quand le seau est plein
+        tokens = min(tokens, self.tpm) if self.tpm else 0
+        with self._bucket() as state:
+            self._refill(state, now)
+            if state["blocked_until"] > now:
+                return state["blocked_until"] - now
+            waits = []
+            if self.rpm and state["requests"] < 1:
+                waits.append((1 - state["requests"]) * 60 / self.rpm)
+            if self.tpm and state["tokens"] < tokens:
+                waits.append((tokens - state["tokens"]) * 60 / self.tpm)
+            if waits:
+                return max(waits)
+            if self.rpm:
+                state["requests"] -= 1
+            state["tokens"] -= tokens
+            return 0.0
+
+    def acquire(self, tokens=0):
+        # Bloque jusqu'à ce que le budget permette l'appel ; renvoie le temps d'attente (s)
+        if not self.rpm and not self.tpm:
+            return 0.0
+        entry = (_priority.get(), next(self._sequence))
+        started = time.perf_counter()
+        with self._condition:
+            heapq.heappush(self._waiters, entry)
+            self._condition.notify_all()
+            try:
+                while True:
+                    timeout = None
+                    if self._waiters[0] == entry:
+                        timeout = self._take(tokens)
+                        if not timeout:
+                            break
+                    # Réveil à l'échéance, ou dès qu'un appel plus prioritaire arrive ou passe
+                    self._condition.wait(timeout)
+            finally:
+                self._waiters.remove(entry)
+                heapq.heapify(self._waiters)
+                self._condition.notify_all()
+        waited = time.perf_counter() - started
+        if waited > 0.001:
+            metrics.count("rate_limit_waits", limiter=self.name, priority=entry[0])
+            metrics.annotate(rate_limit_wait=round(waited, 4))
+        return waited
+
+    def settle(self, estimated, actual):
+        # Rend (ou reprend) l'écart entre les jetons réservés et ceux réellement consommés
+        if not self.tpm or estimated == actual:
+            return
+        with self._bucket() as state:
+            self._refill(state, time.time())
+            state["tokens"] = min(self.tpm, state["tokens"] + min(estimated, self.tpm) - actual)
+        with self._condition:
+            self._condition.notify_all()
+
+    def pause(self, seconds):
+        # Réponse 429 : aucun appel n'est lancé avant l'échéance, tous workers confondus
+        with self._bucket() as state:
+            state["blocked_until"] = max(state["blocked_until"], time.time() + seconds)
+
+
+@lru_cache(maxsize=None)
+def get_limiter(name):
+    # Un limiteur par famille d'appels ("chat", "embeddings"), partagé par tout le processus
+    rpm, tpm = {
+        "chat": (config.CHAT_RPM, config.CHAT_TPM),
+        "embeddings": (config.EMBEDDING_RPM, config.EMBEDDING_TPM),
+    }[name]
+    return RateLimiter(name, rpm, tpm, path=config.RATE_LIMIT_DB or None)
+
+
+class Coalescer:
+    # Fusion des appels identiques en cours : un seul part, les autres attendent son résultat
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._in_flight = {}
+
+    def run(self, key, func):
+        # Renvoie (résultat, partagé) ; partagé est vrai si le résultat vient d'un autre appel
+        with self._lock:
+            future = self._in_flight.get(key)
+            leader = future is None
+            if leader:
+                future = self._in_flight[key] = Future()
+        if not leader:
+            metrics.count("coalesced_requests")
+            return future.result(), True
+        try:
+            result = func()
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(result)
+            return result, False
+        finally:
+            with self._lock:
+                self._in_flight.pop(key, None)
@@ -0,0 +1,174 @@
+import json
+import os
+import sys
+import threading
+from collections import OrderedDict, namedtuple
+
+import config
+import metrics
+
+# Mémoire du worker : les objets volumineux gardés entre deux affichages (index FAISS chargés,
+# sections en cache, exports rendus) sont enregistrés ici avec leur taille estimée. Au-delà du
+# plafond d'une session ou du plafond global, les moins récemment utilisés sont libérés ; ils
+# restent sur disque (index sauvegardés, cache des sections, cache des exports) et sont relus
+# à la demande.
+
+Entry = namedtuple("Entry", ["value", "size", "session", "kind"])
+
+# Entrées partagées par toutes les sessions (un index sert à tous ceux qui envoient le même PDF)
+SHARED = None
+
+
+def entry_size(entry):
+    # Taille approximative d'une entrée JSON (section en cache)
+    return sys.getsizeof(json.dumps(entry, ensure_ascii=False))
+
+
+def index_size(db):
+    # Vecteurs FAISS, copie normalisée de la recherche hybride et textes des extraits
+    index = db.index
+    texts = sum(sys.getsizeof(document.page_content) for document in getattr(db.docstore, "_dict", {}).values())
+    return index.ntotal * index.d * 4 * 2 + texts
+
+
+def process_rss():
+    # Mémoire résidente actuelle du processus (Linux), None ailleurs
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+class ResourceManager:
+
+    def __init__(self, global_limit=None, session_limit=None):
+        self.global_limit = config.MEMORY_LIMIT_BYTES if global_limit is None else global_limit
+        self.session_limit = config.SESSION_MEMORY_LIMIT_BYTES if session_limit is None else session_limit
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._sessions = {}
+        self._total = 0
+        self.evictions = 0
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            self._entries.move_to_end(key)
+            return entry.value
+
+    def put(self, key, value, size, session=SHARED, kind="other"):
+        with self._lock:
+            self._remove(key)
+            self._entries[key] = Entry(value, size, session, kind)
+            self._total += size
+            if session is not SHARED:
+                self._sessions[session] = self._sessions.get(session, 0) + size
+            self._evict(key, session)
+        self._publish()
+        return value
+
+    def discard(self, key):
+        with self._lock:
+            self._remove(key)
+        self._publish()
+
+    def release_session(self, session):
+        # Libère tout ce qu'une session a enregistré (ex. nouvelle version du plan)
+        with self._lock:
+            for key in [key for key, entry in self._entries.items() if entry.session == session]:
+                self._remove(key)
+        self._publish()
+
+    def _remove(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return None
+        self._total -= entry.size
+        if entry.session is not SHARED:
+            self._sessions[entry.session] -= entry.size
+            if self._sessions[entry.session] <= 0:
+                del self._sessions[entry.session]
+        return entry
+
+    def _evict(self, newest, session):
+        # Du moins au plus récemment utilisé ; l'entrée qui vient d'être ajoutée est conservée
+        if session is not SHARED:
+            for key in [key for key, entry in self._entries.items() if entry.session == session and key != newest]:
+                if self._sessions.get(session, 0) <= self.session_limit:
+                    break
+                self._evicted(self._remove(key))
+        for key in [key for key in self._entries if key != newest]:
+            if self._total <= self.global_limit:
+                break
+            self._evicted(self._remove(key))
+
+    def _evicted(self, entry):
+        self.evictions += 1
+        metrics.count("memory_evictions", kind=entry.kind)
+
+    def usage(self):
+        with self._lock:
+            by_kind = {}
+            for entry in self._entries.values():
+                by_kind[entry.kind] = by_kind.get(entry.kind, 0) + entry.size
+            return {
+                "tracked_bytes": self._total,
+                "global_limit_bytes": self.global_limit,
+                "session_limit_bytes": self.session_limit,
+                "entries": len(self._entries),
+                "sessions": dict(self._sessions),
+                "by_kind": by_kind,
+                "evictions": self.evictions,
+                "process_rss_bytes": process_rss(),
+            }
+
+    def _publish(self):
+        usage = self.usage()
+        metrics.gauge("memory_tracked_bytes", usage["tracked_bytes"])
+        metrics.gauge("memory_sessions", len(usage["sessions"]))
+        if usage["process_rss_bytes"] is not None:
+            metrics.gauge("process_rss_bytes", usage["process_rss_bytes"])
+
+
+class ResourcePool:
+    # Vue dictionnaire d'une famille d'entrées du gestionnaire (ex. mémoire de SectionCache)
+
+    def __init__(self, manager, kind, sizeof, session=SHARED):
+        self.manager = manager
+        self.kind = kind
+        self.sizeof = sizeof
+        self.session = session
+
+    def __getitem__(self, key):
+        value = self.manager.get((self.kind, key))
+        if value is None:
+            raise KeyError(key)
+        return value
+
+    def __setitem__(self, key, value):
+        self.manager.put((self.kind, key), value, self.sizeof(value), session=self.session, kind=self.kind)
+
+    def get(self, key, default=None):
+        value = self.manager.get((self.kind, key))
+        return default if value is None else value
+
+    def pop(self, key, default=None):
+        value = self.manager.get((self.kind, key))
+        self.manager.discard((self.kind, key))
+        return default if value is None else value
+
+
+_manager = None
+_manager_lock = threading.Lock()
+
+
+def get_manager():
+    # Un gestionnaire par processus, partagé par toutes les sessions
+    global _manager
+    with _manager_lock:
+        if _manager is None:
+            _manager = ResourceManager()
+        return _manager
@@ -0,0 +1,147 @@
+import math
+import re
+import threading
+import unicodedata
+import weakref
+from collections import Counter
+
+import numpy as np
+
+import config
+
+# Recherche hybride dans le document : score BM25 sur un index inversé des extraits combiné
+# à la similarité cosinus des vecteurs FAISS, puis diversification MMR pour éviter que
+# toutes les sections reçoivent les mêmes extraits.
+
+STOPWORDS = set("""
+a au aux avec ce ces cet cette dans de des du elle en est et il ils je la le les leur leurs
+mais ne nous on ou par pas pour qu que qui sa se ses son sont sur ta te tes un une vos votre
+vous y d l s c n j m t the of and to in for
+""".split())
+
+WORD = re.compile(r"\w+")
+
+
+def tokenize(text):
+    # Minuscules sans accents, mots vides retirés, pluriels simples ramenés au singulier
+    text = unicodedata.normalize("NFKD", text.lower())
+    text = "".join(char for char in text if not unicodedata.combining(char))
+    terms = []
+    for word in WORD.findall(text):
+        if word in STOPWORDS or word.isdigit():
+            continue
+        if len(word) > 3 and word[-1] in "sx":
+            word = word[:-1]
+        terms.append(word)
+    return terms
+
+
+class BM25Index:
+    # Index inversé : terme → [(extrait, fréquence)]
+
+    def __init__(self, texts, k1=1.5, b=0.75):
+        self.k1 = k1
+        self.b = b
+        self.postings = {}
+        self.lengths = np.zeros(len(texts), dtype=np.float32)
+        for doc_id, text in enumerate(texts):
+            terms = Counter(tokenize(text))
+            self.lengths[doc_id] = sum(terms.values())
+            for term, frequency in terms.items():
+                self.postings.setdefault(term, []).append((doc_id, frequency))
+        self.average_length = float(self.lengths.mean()) if len(texts) else 0.0
+
+    def scores(self, query):
+        scores = np.zeros(len(self.lengths), dtype=np.float32)
+        count = len(self.lengths)
+        for term in set(tokenize(query)):
+            postings = self.postings.get(term)
+            if not postings:
+                continue
+            idf = math.log(1 + (count - len(postings) + 0.5) / (len(postings) + 0.5))
+            ids = np.fromiter((doc_id for doc_id, _ in postings), dtype=np.int64, count=len(postings))
+            frequencies = np.fromiter((frequency for _, frequency in postings), dtype=np.float32, count=len(postings))
+            norm = self.k1 * (1 - self.b + self.b * self.lengths[ids] / max(self.average_length, 1.0))
+            scores[ids] += idf * frequencies * (self.k1 + 1) / (frequencies + norm)
+        return scores
+
+
+def _unit_rows(vectors):
+    vectors = np.asarray(vectors, dtype=np.float32)
+    return vectors / np.maximum(np.linalg.norm(vectors, axis=-1, keepdims=True), 1e-12)
+
+
+def _rescale(scores):
+    low, high = float(scores.min()), float(scores.max())
+    return (scores - low) / (high - low) if high > low else np.zeros_like(scores)
+
+
+def mmr(relevance, vectors, k, lambda_mult):
+    # Maximal Marginal Relevance : à chaque étape, l'extrait le plus pertinent
+    # parmi ceux qui ressemblent le moins aux extraits déjà retenus
+    selected = []
+    redundancy = np.full(len(relevance), -np.inf, dtype=np.float32)
+    for _ in range(min(k, len(relevance))):
+        penalty = np.where(np.isfinite(redundancy), redundancy, 0.0)
+        scores = lambda_mult * relevance - (1 - lambda_mult) * penalty
+        scores[selected] = -np.inf
+        best = int(np.argmax(scores))
+        selected.append(best)
+        redundancy = np.maximum(redundancy, vectors @ vectors[best])
+    return selected
+
+
+class HybridRetriever:
+
+    def __init__(self, texts, vectors):
+        self.texts = list(texts)
+        self.vectors = _unit_rows(vectors)
+        self.lexical = BM25Index(self.texts)
+
+    @classmethod
+    def from_faiss(cls, db):
+        # Extraits et vecteurs relus depuis l'index FAISS plat (aucun nouvel appel d'embedding)
+        count = db.index.ntotal
+        texts = [db.docstore.search(db.index_to_docstore_id[i]).page_content for i in range(count)]
+        return cls(texts, db.index.reconstruct_n(0, count))
+
+    def search(self, query, query_vector, k=None, fetch_k=None, lambda_mult=None, lexical_weight=None):
+        if not self.texts:
+            return []
+        k = k or config.RETRIEVAL_TOP_K
+        fetch_k = max(k, fetch_k or config.RETRIEVAL_FETCH_K)
+        lambda_mult = config.RETRIEVAL_MMR_LAMBDA if lambda_mult is None else lambda_mult
+        lexical_weight = config.RETRIEVAL_LEXICAL_WEIGHT if lexical_weight is None else lexical_weight
+
+        dense = self.vectors @ _unit_rows(query_vector)
+        fused = (1 - lexical_weight) * _rescale(dense) + lexical_weight * _rescale(self.lexical.scores(query))
+        candidates = np.argsort(-fused)[:fetch_k]
+        selected = mmr(fused[candidates], self.vectors[candidates], k, lambda_mult)
+        return [self.texts[candidates[i]] for i in selected]
+
+
+_retrievers = weakref.WeakKeyDictionary()
+_retrievers_lock = threading.Lock()
+
+
+def retriever_for(db):
+    # Un index BM25 par index FAISS chargé, construit à sa première recherche
+    with _retrievers_lock:
+        retriever = _retrievers.get(db)
+        if retriever is None:
+            retriever = _retrievers[db] = HybridRetriever.from_faiss(db)
+        return retriever
+
+
+_query_vectors = {}
+_query_lock = threading.Lock()
+
+
+def query_vectors(queries, embeddings):
+    # Requêtes fixes des sections : embeddées en un seul lot, une fois par processus
+    with _query_lock:
+        missing = list(dict.fromkeys(query for query in queries if (config.EMBEDDING_MODEL, query) not in _query_vectors))
+        if missing:
+            for query, vector in zip(missing, embeddings.embed_documents(missing)):
+                _query_vectors[(config.EMBEDDING_MODEL, query)] = np.asarray(vector, dtype=np.float32)
+        return {query: _query_vectors[(config.EMBEDDING_MODEL, query)] for query in queries}
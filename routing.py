@@ -0,0 +1,104 @@
+import math
+import threading
+from collections import deque, namedtuple
+from functools import lru_cache
+
+import config
+import metrics
+
+# Routage par section : modèle, longueur maximale de réponse, température et délai d'attente
+# choisis section par section (manifeste des modèles, puis ISHAI_ROUTES), avec un modèle de
+# repli lorsque le délai est dépassé. La latence et le coût de chaque choix sont mesurés
+# pour ajuster les routes à partir de données réelles.
+
+Route = namedtuple("Route", ["model", "max_tokens", "temperature", "timeout", "fallback"])
+
+
+@lru_cache(maxsize=None)
+def route_for(template):
+    settings = {"model": config.CHAT_MODEL, "max_tokens": None, "temperature": config.TEMPERATURE, "timeout": None, "fallback": config.FALLBACK_MODEL or None}
+    for overrides in (dict(template.route), config.ROUTES.get(template.name, {})):
+        unknown = set(overrides) - set(Route._fields)
+        if unknown:
+            raise ValueError(f"Paramètres de routage inconnus pour {template.name} : {', '.join(sorted(unknown))}")
+        settings.update(overrides)
+    if settings["fallback"] == settings["model"]:
+        settings["fallback"] = None
+    if settings["timeout"] is None:
+        # Avec un modèle de repli, on n'attend pas le délai complet du modèle principal
+        settings["timeout"] = config.ROUTE_TIMEOUT if settings["fallback"] else config.OPENAI_TIMEOUT
+    return Route(**settings)
+
+
+def cost(model, prompt_tokens, completion_tokens):
+    # Coût en dollars (tarifs par millier de jetons de config.MODEL_PRICES), None si le modèle n'y figure pas
+    prices = config.MODEL_PRICES.get(model)
+    if prices is None:
+        return None
+    return (prompt_tokens * prices[0] + completion_tokens * prices[1]) / 1000
+
+
+def percentile(values, q):
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(q * len(ordered)) - 1)] if ordered else 0.0
+
+
+class RouteStats:
+    # Mesures par (section, modèle) depuis le démarrage du processus ; latences des derniers appels
+
+    def __init__(self, window=500):
+        self.window = window
+        self._lock = threading.Lock()
+        self._entries = {}
+
+    def _entry(self, section, model):
+        return self._entries.setdefault((section, model), {
+            "calls": 0, "timeouts": 0, "length_limited": 0, "latencies": deque(maxlen=self.window),
+            "prompt_tokens": 0, "completion_tokens": 0, "cost_usd": 0.0,
+        })
+
+    def record(self, section, model, seconds, prompt_tokens, completion_tokens):
+        price = cost(model, prompt_tokens, completion_tokens)
+        with self._lock:
+            entry = self._entry(section, model)
+            entry["calls"] += 1
+            entry["latencies"].append(seconds)
+            entry["prompt_tokens"] += prompt_tokens
+            entry["completion_tokens"] += completion_tokens
+            entry["cost_usd"] += price or 0.0
+        metrics.count("llm_calls", section=section, model=model)
+        if price is not None:
+            metrics.count("llm_cost_usd", price, section=section, model=model)
+        return price
+
+    def timeout(self, section, model):
+        with self._lock:
+            self._entry(section, model)["timeouts"] += 1
+        metrics.count("llm_timeouts", section=section, model=model)
+
+    def length_limited(self, section, model):
+        # Réponse arrêtée par max_tokens (finish_reason "length")
+        with self._lock:
+            self._entry(section, model)["length_limited"] += 1
+        metrics.count("llm_length_limited", section=section, model=model)
+
+    def summary(self):
+        with self._lock:
+            rows = []
+            for (section, model), entry in sorted(self._entries.items()):
+                calls = entry["calls"]
+                rows.append({
+                    "section": section,
+                    "model": model,
+                    "calls": calls,
+                    "timeouts": entry["timeouts"],
+                    "length_limited": entry["length_limited"],
+                    "p50_seconds": round(percentile(entry["latencies"], 0.5), 3),
+                    "p95_seconds": round(percentile(entry["latencies"], 0.95), 3),
+                    "mean_completion_tokens": round(entry["completion_tokens"] / calls, 1) if calls else 0.0,
+                    "cost_usd": round(entry["cost_usd"], 5),
+                })
+            return rows
+
+
+STATS = RouteStats()
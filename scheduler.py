@@ -0,0 +1,100 @@
+import contextvars
+import random
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+import openai
+
+import config
+import metrics
+
+# Erreurs transitoires de l'API OpenAI qui justifient une nouvelle tentative
+RETRYABLE_ERRORS = (
+    openai.error.RateLimitError,
+    openai.error.ServiceUnavailableError,
+    openai.error.APIConnectionError,
+    openai.error.Timeout,
+    openai.error.TryAgain,
+)
+
+
+def _retry_after(error):
+    headers = getattr(error, "headers", None) or {}
+    try:
+        return float(headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return None
+
+
+def call_with_backoff(func, *args, limiter=None, tokens=0, retryable=RETRYABLE_ERRORS, **kwargs):
+    # Backoff exponentiel avec gigue, en respectant l'en-tête Retry-After si présent
+    # limiter : chaque tentative attend son tour (requête + jetons estimés) dans le limiteur partagé
+    # retryable : erreurs rejouées (les autres remontent immédiatement à l'appelant)
+    delay = config.BACKOFF_BASE_DELAY
+    for attempt in range(config.MAX_RETRIES + 1):
+        if limiter is not None:
+            limiter.acquire(tokens)
+        try:
+            return func(*args, **kwargs)
+        except Exception as e:
+            if limiter is not None:
+                # Tentative échouée : les jetons réservés sont rendus, seule la tentative réussie
+                # reste à régler par l'appelant (limiter.settle)
+                limiter.settle(tokens, 0)
+            if not isinstance(e, retryable) or attempt == config.MAX_RETRIES:
+                raise
+            wait_time = _retry_after(e) or delay * (1 + random.random())
+            if limiter is not None and isinstance(e, openai.error.RateLimitError):
+                # Les autres appels du limiteur attendent aussi au lieu de déclencher d'autres 429
+                limiter.pause(min(wait_time, config.BACKOFF_MAX_DELAY))
+            metrics.count("llm_retries", error=type(e).__name__)
+            metrics.annotate(retries=attempt + 1)
+            time.sleep(min(wait_time, config.BACKOFF_MAX_DELAY))
+            delay *= 2
+
+
+def _check_graph(names, dependencies):
+    for name, deps in dependencies.items():
+        for dep in deps:
+            if dep not in names:
+                raise ValueError(f"Section inconnue dans les dépendances de {name}: {dep}")
+    # Détection de cycle par tri topologique
+    remaining = {name: set(dependencies.get(name, ())) for name in names}
+    while remaining:
+        ready = [name for name, deps in remaining.items() if not deps]
+        if not ready:
+            raise ValueError(f"Dépendances cycliques entre les sections: {', '.join(remaining)}")
+        for name in ready:
+            del remaining[name]
+        for deps in remaining.values():
+            deps.difference_update(ready)
+
+
+def run_dependency_graph(tasks, dependencies, on_done=None, max_workers=None):
+    # tasks : {nom: fonction(résultats_des_dépendances)}
+    # Les tâches sans dépendance en attente s'exécutent en parallèle ; on_done est
+    # appelé dans le thread appelant dès qu'une tâche se termine.
+    _check_graph(tasks.keys(), dependencies)
+    max_workers = max_workers or config.MAX_CONCURRENT_SECTIONS
+    results = {}
+    pending = dict(tasks)
+    running = {}
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        while pending or running:
+            for name in list(pending):
+                deps = dependencies.get(name, ())
+                if all(dep in results for dep in deps):
+                    upstream = {dep: results[dep] for dep in deps}
+                    # Chaque tâche hérite du contexte de l'appelant (trace de la génération en cours)
+                    context = contextvars.copy_context()
+                    running[executor.submit(context.run, pending.pop(name), upstream)] = name
+
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                name = running.pop(future)
+                results[name] = future.result()
+                if on_done:
+                    on_done(name, results[name])
+
+    return results
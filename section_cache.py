@@ -0,0 +1,72 @@
+import hashlib
+import json
+import os
+import tempfile
+import time
+
+import config
+
+
+def make_key(doc_hash, user_text, system_message, query, model, temperature, max_tokens=None):
+    # Clé déterministe construite à partir de toutes les entrées d'une section
+    payload = json.dumps([doc_hash, user_text, system_message, query, model, temperature, max_tokens], ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class SectionCache:
+    # Cache à deux niveaux : dictionnaire en mémoire (ex. st.session_state) puis fichiers JSON sur disque
+
+    def __init__(self, memory=None, directory=config.SECTION_CACHE_DIR):
+        self.memory = memory if memory is not None else {}
+        self.directory = directory
+
+    def _path(self, key):
+        return os.path.join(self.directory, f"{key}.json")
+
+    def get(self, key):
+        # Renvoie l'entrée {"content": ..., "tokens": ...} ou None
+        entry = self.memory.get(key)
+        if entry is not None:
+            return entry
+        try:
+            with open(self._path(key), encoding="utf-8") as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            return None
+        self.memory[key] = entry
+        return entry
+
+    def set(self, key, entry):
+        self.memory[key] = entry
+        os.makedirs(self.directory, exist_ok=True)
+        # Écriture atomique pour les accès concurrents entre sessions
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(entry, f, ensure_ascii=False)
+        os.replace(tmp_path, self._path(key))
+
+    def invalidate(self, key):
+        self.memory.pop(key, None)
+        try:
+            os.remove(self._path(key))
+        except FileNotFoundError:
+            pass
+
+    def purge(self, retention):
+        # Supprime les sections écrites il y a plus de retention secondes
+        cutoff = time.time() - retention
+        removed = 0
+        try:
+            names = os.listdir(self.directory)
+        except FileNotFoundError:
+            return 0
+        for name in names:
+            path = os.path.join(self.directory, name)
+            try:
+                if os.path.getmtime(path) < cutoff:
+                    os.remove(path)
+                    self.memory.pop(name.split(".", 1)[0], None)
+                    removed += 1
+            except FileNotFoundError:
+                pass
+        return removed
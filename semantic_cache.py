@@ -0,0 +1,141 @@
+import hashlib
+import json
+import os
+import threading
+import time
+
+import numpy as np
+
+import config
+import metrics
+from database import connect
+
+# Cache sémantique des réponses : une section déjà rédigée pour un prompt presque identique
+# (même secteur, même région...) est réutilisée sans appel au LLM.
+# Un index FAISS en mémoire par espace de noms (section + consignes + modèle), entrées dans SQLite.
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS entries (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    namespace TEXT NOT NULL,
+    vector BLOB NOT NULL,
+    entry TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    last_used REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS entries_namespace ON entries (namespace, id);
+CREATE INDEX IF NOT EXISTS entries_last_used ON entries (last_used);
+"""
+
+
+def namespace(template, model, temperature, max_tokens=None):
+    # Une modification des consignes ou de la route (modèle, température, longueur) ouvre un nouvel espace de cache
+    payload = json.dumps([template.name, template.system_message, model, temperature, max_tokens], ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()[:32]
+
+
+def _unit(vector):
+    vector = np.asarray(vector, dtype=np.float32)
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+
+class SemanticCache:
+
+    def __init__(self, directory=config.SEMANTIC_CACHE_DIR, threshold=None, ttl=None, max_entries=None, embeddings=None):
+        self.directory = directory
+        self.threshold = config.SEMANTIC_CACHE_THRESHOLD if threshold is None else threshold
+        self.ttl = config.SEMANTIC_CACHE_TTL if ttl is None else ttl
+        self.max_entries = max_entries or config.SEMANTIC_CACHE_MAX_ENTRIES
+        self._embeddings = embeddings
+        os.makedirs(directory, exist_ok=True)
+        self.db_path = os.path.join(directory, "entries.sqlite3")
+        self._lock = threading.Lock()
+        # espace de noms → (index FAISS, dernier id chargé)
+        self._indexes = {}
+        self.hits = {}
+        self.misses = {}
+        with connect(self.db_path) as conn:
+            conn.executescript(SCHEMA)
+
+    def _embed(self, text):
+        if self._embeddings is None:
+            from clients import get_embeddings
+
+            self._embeddings = get_embeddings()
+        return _unit(self._embeddings.embed_query(text))
+
+    def _index(self, conn, space, dimension):
+        # Index de l'espace de noms, complété par les entrées ajoutées depuis (autres workers compris)
+        import faiss
+
+        index, last_id = self._indexes.get(space, (None, 0))
+        if index is None:
+            index = faiss.IndexIDMap2(faiss.IndexFlatIP(dimension))
+        rows = conn.execute("SELECT id, vector FROM entries WHERE namespace = ? AND id > ? ORDER BY id", (space, last_id)).fetchall()
+        if rows:
+            vectors = np.stack([np.frombuffer(vector, dtype=np.float32) for _, vector in rows])
+            index.add_with_ids(vectors, np.asarray([row_id for row_id, _ in rows], dtype=np.int64))
+            last_id = rows[-1][0]
+        self._indexes[space] = (index, last_id)
+        return index
+
+    def _forget(self, space, ids):
+        index, _ = self._indexes.get(space, (None, 0))
+        if index is not None and len(ids):
+            index.remove_ids(np.asarray(ids, dtype=np.int64))
+
+    def lookup(self, space, section, prompt):
+        # Renvoie (entrée ou None, similarité, vecteur du prompt à réutiliser pour store())
+        vector = self._embed(prompt)
+        now = time.time()
+        with self._lock, connect(self.db_path) as conn:
+            index = self._index(conn, space, len(vector))
+            while index.ntotal:
+                scores, ids = index.search(vector.reshape(1, -1), 1)
+                similarity, row_id = float(scores[0][0]), int(ids[0][0])
+                if row_id < 0 or similarity < self.threshold:
+                    break
+                row = conn.execute("SELECT entry, created_at FROM entries WHERE id = ?", (row_id,)).fetchone()
+                if row is None or row[1] < now - self.ttl:
+                    # Entrée expirée ou évincée par un autre worker : on l'oublie et on cherche la suivante
+                    conn.execute("DELETE FROM entries WHERE id = ?", (row_id,))
+                    self._forget(space, [row_id])
+                    continue
+                conn.execute("UPDATE entries SET last_used = ? WHERE id = ?", (now, row_id))
+                self.hits[section] = self.hits.get(section, 0) + 1
+                metrics.count("semantic_cache", section=section, result="hit")
+                return json.loads(row[0]), similarity, vector
+        self.misses[section] = self.misses.get(section, 0) + 1
+        metrics.count("semantic_cache", section=section, result="miss")
+        return None, None, vector
+
+    def store(self, space, vector, entry):
+        now = time.time()
+        with self._lock, connect(self.db_path) as conn:
+            conn.execute(
+                "INSERT INTO entries (namespace, vector, entry, created_at, last_used) VALUES (?, ?, ?, ?, ?)",
+                (space, np.asarray(vector, dtype=np.float32).tobytes(), json.dumps(entry, ensure_ascii=False), now, now),
+            )
+            # Éviction des entrées expirées puis des moins récemment utilisées au-delà de la taille maximale
+            evicted = conn.execute(
+                "SELECT id, namespace FROM entries WHERE created_at < ? "
+                "UNION SELECT id, namespace FROM entries WHERE id NOT IN "
+                "(SELECT id FROM entries ORDER BY last_used DESC LIMIT ?)",
+                (now - self.ttl, self.max_entries),
+            ).fetchall()
+            if evicted:
+                conn.executemany("DELETE FROM entries WHERE id = ?", [(row_id,) for row_id, _ in evicted])
+                by_space = {}
+                for row_id, evicted_space in evicted:
+                    by_space.setdefault(evicted_space, []).append(row_id)
+                for evicted_space, ids in by_space.items():
+                    self._forget(evicted_space, ids)
+
+    def stats(self):
+        # Taux de réutilisation par section depuis le démarrage du processus
+        report = {}
+        for section in sorted(set(self.hits) | set(self.misses)):
+            hits, misses = self.hits.get(section, 0), self.misses.get(section, 0)
+            report[section] = {"hits": hits, "misses": misses, "hit_rate": round(hits / (hits + misses), 3)}
+        return report
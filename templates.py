@@ -0,0 +1,82 @@
+import json
+import os
+import re
+from collections import OrderedDict, namedtuple
+from functools import lru_cache
+
+import config
+from context_builder import count_tokens
+from markdown_blocks import TABLE_SEPARATOR
+
+# Registre versionné des sections du business plan : templates/<version>/manifest.json
+# (ordre, requête, dépendances) et un fichier de consignes par section
+
+SectionTemplate = namedtuple("SectionTemplate", ["name", "system_message", "query", "depends_on", "system_tokens", "query_tokens", "semantic_cache", "route"])
+
+def normalize_template(text):
+    # L'indentation et l'alignement des tableaux sont facturés comme des jetons sans rien apporter au modèle
+    lines = []
+    for line in text.strip().split("\n"):
+        line = re.sub(r"[ \t]{2,}", " ", line.strip())
+        if TABLE_SEPARATOR.match(line):
+            line = "|" + "|".join("---" for _ in line.strip("|").split("|")) + "|"
+        lines.append(line)
+    return re.sub(r"\n{3,}", "\n\n", "\n".join(lines))
+
+
+def manifest_names(manifest):
+    return [section["name"] for section in manifest["sections"]]
+
+
+def _selected_sections(manifest, sections):
+    names = manifest_names(manifest)
+    if not sections:
+        return names
+    unknown = [name for name in sections if name not in names]
+    if unknown:
+        raise ValueError(f"Sections inconnues dans le modèle {manifest['version']} : {', '.join(unknown)}")
+    # L'ordre du manifeste est conservé
+    return [name for name in names if name in sections]
+
+
+@lru_cache(maxsize=None)
+def load_templates(version=config.TEMPLATE_VERSION, sections=config.SECTIONS, directory=config.TEMPLATE_DIR):
+    # Lu, normalisé et compté une seule fois par processus
+    template_dir = os.path.join(directory, version)
+    try:
+        with open(os.path.join(template_dir, "manifest.json"), encoding="utf-8") as f:
+            manifest = json.load(f)
+    except FileNotFoundError:
+        raise ValueError(f"Modèle de business plan introuvable : {template_dir}")
+
+    names = manifest_names(manifest)
+    selected = _selected_sections(manifest, sections)
+    templates = OrderedDict()
+    for section in manifest["sections"]:
+        if section["name"] not in selected:
+            continue
+        with open(os.path.join(template_dir, section["file"]), encoding="utf-8") as f:
+            system_message = normalize_template(f.read())
+        query = normalize_template(section["query"])
+        unknown = [name for name in section.get("depends_on", []) if name not in names]
+        if unknown:
+            raise ValueError(f"Dépendances inconnues pour {section['name']} : {', '.join(unknown)}")
+        # Une section désactivée dans ce déploiement n'est plus une dépendance
+        depends_on = tuple(name for name in section.get("depends_on", []) if name in selected)
+        templates[section["name"]] = SectionTemplate(
+            section["name"],
+            system_message,
+            query,
+            depends_on,
+            count_tokens(system_message),
+            count_tokens(query),
+            # Réponses réutilisables par le cache sémantique (sections peu propres à un porteur de projet)
+            bool(section.get("semantic_cache", False)),
+            # Modèle, longueur de réponse, température... propres à la section (voir routing.route_for)
+            tuple(sorted(section.get("route", {}).items())),
+        )
+    return templates
+
+
+def dependencies(templates):
+    return {name: list(template.depends_on) for name, template in templates.items() if template.depends_on}
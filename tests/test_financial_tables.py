@@ -0,0 +1,105 @@
+import pytest
+
+from financial_tables import _cell_value, extract_tables, parse_amounts
+
+
+@pytest.mark.parametrize("text, expected", [
+    ("1 500 US $", [1500.0]),
+    ("2,500.50", [2500.5]),
+    ("2.500,50 €", [2500.5]),
+    ("1.234.567", [1234567.0]),
+    ("12,5", [12.5]),
+    ("500 / 6 000", [500.0, 6000.0]),
+    ("**3 000**", [3000.0]),
+    ("-200", [-200.0]),
+    ("Remise -200", [-200.0]),
+    # Fourchettes : le tiret n'est pas un signe moins
+    ("1 500-2 000", [1500.0, 2000.0]),
+    ("1 500 - 2 000", [1500.0, 2000.0]),
+    ("1 000–1 200", [1000.0, 1200.0]),
+    # Un zéro seul n'est jamais suivi d'un séparateur de milliers
+    ("0,500", [0.5]),
+    ("0.500", [0.5]),
+    ("15 %", []),
+    ("-", []),
+    ("n/a", []),
+])
+def test_parse_amounts(text, expected):
+    assert parse_amounts(text) == expected
+
+
+def test_single_amount():
+    assert _cell_value("1 500", "Montant (US $)") == (1500.0, None)
+
+
+def test_annual_column_keeps_last_amount():
+    assert _cell_value("500 / 6 000", "Montant mensuel et annuel") == (6000.0, None)
+
+
+def test_several_amounts_warns():
+    value, warning = _cell_value("500 / 6 000", "Montant (US $)")
+    assert value is None and "plusieurs montants" in warning
+
+
+@pytest.mark.parametrize("text", ["1 000-1 200", "1 000 - 1 200"])
+def test_range_warns_even_in_annual_column(text):
+    value, warning = _cell_value(text, "Budget annuel")
+    assert value is None and "fourchette" in warning
+
+
+def test_unreadable_amount_warns():
+    value, warning = _cell_value("à définir", "Montant")
+    assert value is None and "illisible" in warning
+
+
+def test_empty_cell_is_silent():
+    assert _cell_value("-", "Montant") == (None, None)
+
+
+def test_table_totals_and_stated_total_check():
+    content = "\n".join([
+        "Besoins de démarrage :",
+        "",
+        "| Poste de coût | Montant (US $) | Explication |",
+        "|---|---|---|",
+        "| Four | 12 000 | cuisson |",
+        "| Stock | 3 500 | initial |",
+        "| **Total** | 16 000 | |",
+    ])
+    [table] = extract_tables({"Besoin de Démarrage": content})
+    assert table.title == "Besoins de démarrage"
+    assert table.totals == {1: 15500.0}
+    assert len(table.rows) == 2
+    assert any("total annoncé" in warning for warning in table.warnings)
+
+
+def test_range_is_left_out_of_the_total():
+    content = "\n".join([
+        "| Poste | Budget annuel |",
+        "|---|---|",
+        "| Loyer | 1 000-1 200 |",
+        "| Salaires | 6 000 |",
+    ])
+    [table] = extract_tables({"Besoin de Démarrage": content})
+    assert table.totals == {1: 6000.0}
+    assert any("fourchette" in warning for warning in table.warnings)
+
+
+def test_amount_columns_detected_from_cells():
+    content = "\n".join([
+        "| Action | Janvier | Février | Mars |",
+        "|---|---|---|---|",
+        "| Radio | 200 € | 200 € | 150 € |",
+        "| Flyers | 50 € | - | 50 € |",
+    ])
+    [table] = extract_tables({"Stratégie Marketing et Moyens Commerciaux": content})
+    assert table.totals == {1: 250.0, 2: 200.0, 3: 200.0}
+
+
+def test_quantity_and_text_columns_are_not_amounts():
+    content = "\n".join([
+        "| Poste | Quantité | Description |",
+        "|---|---|---|",
+        "| Stylos | 10 | bleu |",
+    ])
+    assert extract_tables({"Annexes": content}) == []